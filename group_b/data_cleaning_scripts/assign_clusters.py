@@ -0,0 +1,155 @@
+import argparse
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import joblib
+
+from cluster_artifacts import CACHE_DIR, CLUSTER_MODEL_PATH, META_COLUMNS, encoder_variant, save_cluster_model
+from embedding_store import EmbeddingStore, store_dir
+from group_b.data_io import ProcessCache, file_version, read_table, resolve_path, write_table
+
+logging.basicConfig(level=logging.INFO)
+
+# fitted clustering artifacts by path, versioned by the mtime of the file, and embedding models, loaded once per process
+_cluster_models = ProcessCache()
+_embedding_models = {}
+
+
+def load_cluster_model(path=CLUSTER_MODEL_PATH):
+    """
+    Load the clustering artifact saved by `clean_metadata.py`. The artifact is cached per process and reloaded only
+    when the file on disk changes.
+
+    :param path: Path of the joblib artifact.
+    :return: Dictionary with the fitted MiniBatchKMeans ("kmeans"), the embedding model name ("embedding_model"),
+             the number of clusters and the artifact version.
+    """
+    return _cluster_models.get(path, file_version(path), lambda: joblib.load(path))
+
+
+def get_embedding_model(model_name, backend="torch"):
+    """
+    Load the SentenceTransformer model once per process. `clean_metadata` (sentence_transformers, torch, nltk) is only
+    imported here, so labelling items whose embeddings are all in the store never loads it.
+
+    :param model_name: Name of the SentenceTransformer model.
+    :param backend: "torch" or "onnx", see `clean_metadata.load_embedding_model`.
+    :return: A SentenceTransformer model.
+    """
+    if (model_name, backend) not in _embedding_models:
+        from clean_metadata import load_embedding_model
+        _embedding_models[(model_name, backend)] = load_embedding_model(model_name, backend=backend)
+    return _embedding_models[(model_name, backend)]
+
+
+def assign_clusters(titles, cluster_model_path=CLUSTER_MODEL_PATH, batch_size=256, num_workers=1,
+                    partial_fit=False, use_store=True, backend="torch"):
+    """
+    Assign new products to the clusters found by `clean_metadata.py`, without reclustering the whole catalogue.
+    Titles are embedded in batches with the same embedding model as the clustering and labelled with the nearest
+    frozen centroid.
+
+    :param titles: List of product titles.
+    :param cluster_model_path: Path of the clustering artifact.
+    :param batch_size: Number of titles encoded per forward pass.
+    :param num_workers: Number of encoding processes, see `clean_metadata.encode_titles`.
+    :param partial_fit: If True, update the centroids with the new embeddings (MiniBatchKMeans.partial_fit) before
+                        labelling, and save the updated artifact under a new version. Only the given titles are
+                        labelled with the moved centroids: the cluster_label of products already in the metadata is not
+                        updated, so rerun `clean_metadata.py` to relabel the whole catalogue.
+    :param use_store: If True, reuse and extend the on-disk embedding store so titles are never encoded twice.
+    :param backend: "torch" or "onnx" embedding backend.
+    :return: Numpy array with the cluster label of each title.
+    """
+    titles = pd.Series(titles, dtype=object).astype(str)
+    if titles.empty:
+        return np.empty(0, dtype=np.int32)
+    artifact = load_cluster_model(cluster_model_path)
+    kmeans, model_name = artifact["kmeans"], artifact["embedding_model"]
+
+    def encode_fn(batch):
+        from clean_metadata import encode_titles
+        embedding_model = get_embedding_model(model_name, backend=backend)
+        return encode_titles(embedding_model, batch, batch_size=batch_size, num_workers=num_workers)
+
+    if use_store:
+        encoder = encoder_variant(backend)
+        embeddings = EmbeddingStore(store_dir(CACHE_DIR, encoder), model_name, encoder).encode(titles, encode_fn)
+    else:
+        embeddings = np.asarray(encode_fn(titles.tolist()))
+    embeddings = embeddings.astype(kmeans.cluster_centers_.dtype, copy=False)
+
+    if partial_fit:
+        # let the centroids drift towards the new items, then publish the updated clustering
+        kmeans.partial_fit(embeddings)
+        save_cluster_model(kmeans, cluster_model_path, model_name)
+
+    return kmeans.predict(embeddings)
+
+
+def read_items(path):
+    """
+    Read new items to label, either raw metadata in jsonl format or a csv with at least a title column.
+
+    :param path: Path to a .jsonl or .csv file.
+    :return: DataFrame of items.
+    """
+    if path.endswith(".jsonl"):
+        from clean_metadata import load_metadata
+        return load_metadata(path)
+    return pd.read_csv(path).dropna(subset=['title'])
+
+
+def add_to_metadata(df_items, metadata_path="../data/metadata"):
+    """
+    Append newly labelled items to the cleaned metadata so that demand, inventory and pricing pick them up.
+    Items whose parent_asin is already in the metadata are skipped.
+
+    :param df_items: DataFrame of labelled items with parent_asin and cluster_label columns.
+    :param metadata_path: Path to the cleaned metadata, with or without extension (see `data_io.resolve_path`).
+    :return: Number of items added.
+    """
+    columns = META_COLUMNS + ['cluster_label']
+    df_new = df_items.reindex(columns=columns)
+    df_new = df_new.dropna(subset=['parent_asin']).drop_duplicates(subset=['parent_asin'])
+    try:
+        metadata_path = resolve_path(metadata_path)
+        df_metadata = read_table(metadata_path)
+    except FileNotFoundError:
+        df_metadata = pd.DataFrame(columns=columns)
+    df_new = df_new[~df_new['parent_asin'].isin(df_metadata['parent_asin'])]
+    if not df_new.empty:
+        write_table(pd.concat([df_metadata, df_new], ignore_index=True), metadata_path)
+    return len(df_new)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assign cluster labels to newly listed products.")
+    parser.add_argument("input", help="Items to label, raw metadata .jsonl or .csv with a title column")
+    parser.add_argument("--output", default="../data/new_item_clusters.csv", help="Where to save the labelled items")
+    parser.add_argument("--model", default=CLUSTER_MODEL_PATH, help="Clustering artifact from clean_metadata.py")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=1, help="Number of encoding processes")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch")
+    parser.add_argument("--partial-fit", action="store_true", help="Update the centroids with the new items")
+    parser.add_argument("--add-to-metadata", action="store_true",
+                        help="Append the labelled items to ../data/metadata")
+    args = parser.parse_args()
+    if args.partial_fit and args.add_to_metadata:
+        # the metadata would mix labels of the old and the moved centroids
+        parser.error("--partial-fit moves the centroids without relabelling the metadata, "
+                     "so it cannot be combined with --add-to-metadata")
+
+    df_items = read_items(args.input)
+    logging.info(f"Assigning clusters to {len(df_items)} items")
+    df_items['cluster_label'] = assign_clusters(df_items['title'], cluster_model_path=args.model,
+                                                batch_size=args.batch_size, num_workers=args.workers,
+                                                partial_fit=args.partial_fit, backend=args.backend)
+    print(df_items.head())
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    df_items.to_csv(args.output, index=False)
+    if args.add_to_metadata:
+        logging.info(f"Added {add_to_metadata(df_items)} items to metadata")
@@ -1,14 +1,23 @@
+import json
 import logging
 import os
 import re
+from itertools import islice
 import numpy as np
 import pandas as pd
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
 from tqdm import tqdm
 from sentence_transformers import SentenceTransformer
 from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from joblib import Parallel, delayed
 from nltk.stem.wordnet import WordNetLemmatizer
 from nltk import word_tokenize
+from cluster_artifacts import (CACHE_DIR, CLUSTER_MODEL_PATH, EMBEDDING_MODEL, META_COLUMNS, ONNX_FILE, encoder_variant,
+                               save_cluster_model)
+from embedding_store import EmbeddingStore, store_dir
+from group_b.data_io import write_table
 
 logging.basicConfig(level=logging.INFO)
 tqdm.pandas()
@@ -16,6 +25,59 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"  # disable tokenizers parallelism
 np.random.seed(42)
 
 
+def read_metadata_chunks(path: str, columns=META_COLUMNS, chunk_size: int = 100000):
+    """
+    Stream the raw metadata jsonl file in bounded chunks, keeping only the columns needed downstream.
+    Each line is parsed and immediately projected down to `columns`, so nested fields such as images, details and
+    description are never held in a DataFrame. Rows with missing title or parent_asin are dropped, and parent_asin is
+    de-duplicated across chunk boundaries (the first occurrence in the file is kept). Non-english titles are removed
+    afterwards, which matches the order of the original whole-file cleaning.
+
+    :param path: Path to the raw metadata jsonl file.
+    :param columns: Columns to keep. Must include 'title' and 'parent_asin'.
+    :param chunk_size: Number of lines parsed per chunk. Peak memory of the reader is bounded by this value.
+    :return: Generator of cleaned DataFrame chunks.
+    """
+    seen_asins = set()
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            lines = list(islice(f, chunk_size))
+            if not lines:
+                break
+            records = []
+            for line in lines:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                records.append({col: item.get(col) for col in columns})
+            chunk = pd.DataFrame.from_records(records, columns=columns)
+
+            # remove NAs and duplications (including those already seen in earlier chunks)
+            chunk = chunk.dropna(subset=['title', 'parent_asin'])
+            chunk = chunk.drop_duplicates(subset=['parent_asin'])
+            chunk = chunk[~chunk['parent_asin'].isin(seen_asins)]
+            seen_asins.update(chunk['parent_asin'])
+
+            # remove rows with non-english title for simplicity
+            chunk = chunk[chunk['title'].map(str.isascii)]
+            yield chunk
+
+
+def load_metadata(path: str, columns=META_COLUMNS, chunk_size: int = 100000) -> pd.DataFrame:
+    """
+    Load and clean the raw metadata with `read_metadata_chunks`, concatenating the projected chunks.
+
+    :param path: Path to the raw metadata jsonl file.
+    :param columns: Columns to keep.
+    :param chunk_size: Number of lines parsed per chunk.
+    :return: Cleaned metadata DataFrame with a fresh index.
+    """
+    chunks = [chunk for chunk in tqdm(read_metadata_chunks(path, columns, chunk_size), desc="Reading metadata chunks")]
+    if not chunks:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(chunks, ignore_index=True)
+
+
 def clean(text: str) -> str:
     """
     Text cleaning for product title e.g. lowercase, remove non-alphanumeric characters, remove extra spaces
@@ -44,6 +106,128 @@ def lemmatize_sentence(lemmatizer, title: str) -> str:
     return " ".join(lemmatized_words)
 
 
+def clean_titles(titles: pd.Series) -> pd.Series:
+    """
+    Vectorized version of `clean` for a whole column of product titles.
+
+    :param titles: Series of product titles
+    :return: Series of cleaned product titles
+    """
+    return (titles.str.lower()
+            .str.replace(r"[^a-zA-Z0-9\s]", " ", regex=True)
+            .str.replace(r"\s+", " ", regex=True)
+            .str.strip())
+
+
+def load_lemma_cache(cache_path: str) -> dict:
+    """
+    Load the token -> lemma lookup saved by previous runs.
+
+    :param cache_path: Path to the json lemma cache.
+    :return: Dictionary mapping each token to its lemmatized form. Empty if no cache exists yet.
+    """
+    if not os.path.exists(cache_path):
+        return {}
+    with open(cache_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_lemma_cache(lemma_cache: dict, cache_path: str):
+    """
+    Save the token -> lemma lookup so later runs only lemmatize unseen tokens.
+
+    :param lemma_cache: Dictionary mapping each token to its lemmatized form.
+    :param cache_path: Path to the json lemma cache.
+    :return: None
+    """
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(lemma_cache, f)
+    os.replace(tmp_path, cache_path)
+
+
+def lemmatize_titles(lemmatizer, titles: pd.Series, cache_path: str = None) -> pd.Series:
+    """
+    Batch version of `lemmatize_sentence` for a column of cleaned titles.
+    Titles are split into whitespace tokens and every unique token is lemmatized only once, through a lookup that is
+    persisted to `cache_path` between runs. Each token still goes through `word_tokenize` so that splits such as
+    "cannot" -> "can not" give the same result as `lemmatize_sentence`.
+
+    :param lemmatizer: A lemmatizer object
+    :param titles: Series of cleaned product titles (output of `clean_titles`)
+    :param cache_path: Path to the json lemma cache. If None, the lookup is not persisted.
+    :return: Series of lemmatized product titles, aligned with `titles`
+    """
+    lemma_cache = load_lemma_cache(cache_path) if cache_path else {}
+
+    tokens = titles.str.split().explode().dropna()
+    new_tokens = [token for token in tokens.unique() if token not in lemma_cache]
+    for token in tqdm(new_tokens, desc="Lemmatizing unique tokens"):
+        lemma_cache[token] = lemmatize_sentence(lemmatizer, token)
+    if cache_path and new_tokens:
+        save_lemma_cache(lemma_cache, cache_path)
+
+    lemmas = tokens.map(lemma_cache).groupby(level=0, sort=False).agg(" ".join)
+    return lemmas.reindex(titles.index, fill_value="")
+
+
+def load_embedding_model(model_name: str = EMBEDDING_MODEL, backend: str = "torch",
+                         onnx_file: str = ONNX_FILE):
+    """
+    Load the sentence embedding model for CPU inference.
+
+    :param model_name: Name of the SentenceTransformer model.
+    :param backend: "torch" for the default pytorch model, or "onnx" to run the exported ONNX model with onnxruntime.
+    :param onnx_file: ONNX file to load from the model repository when backend is "onnx". The default is the
+                      int8-quantized export; use "onnx/model.onnx" for the full precision export.
+    :return: A SentenceTransformer model on CPU.
+    """
+    if backend == "onnx":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs={"file_name": onnx_file})
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def encode_titles(embedding_model, titles, batch_size: int = 256, num_workers: int = None) -> np.ndarray:
+    """
+    Encode product titles on CPU, spreading batches over a pool of worker processes.
+    Titles are sorted by length before batching so that each batch pads to a similar length, and the embeddings are
+    returned in the original order.
+
+    :param embedding_model: A SentenceTransformer model.
+    :param titles: List of product titles.
+    :param batch_size: Number of titles encoded per forward pass.
+    :param num_workers: Number of encoding processes. Default is the number of CPU cores. 1 encodes in this process.
+    :return: Numpy array of shape (len(titles), embedding dimension).
+    """
+    titles = list(titles)
+    num_workers = num_workers or os.cpu_count() or 1
+    order = np.argsort([len(title) for title in titles], kind="stable")
+    sorted_titles = [titles[i] for i in order]
+
+    if num_workers > 1 and len(titles) > batch_size:
+        # give each worker an equal share of the cores so torch threads do not oversubscribe the machine
+        omp_num_threads = os.environ.get("OMP_NUM_THREADS")
+        os.environ["OMP_NUM_THREADS"] = str(max(1, (os.cpu_count() or 1) // num_workers))
+        try:
+            pool = embedding_model.start_multi_process_pool(target_devices=["cpu"] * num_workers)
+        finally:
+            if omp_num_threads is None:
+                os.environ.pop("OMP_NUM_THREADS")
+            else:
+                os.environ["OMP_NUM_THREADS"] = omp_num_threads
+        try:
+            sorted_embeddings = embedding_model.encode_multi_process(sorted_titles, pool, batch_size=batch_size)
+        finally:
+            embedding_model.stop_multi_process_pool(pool)
+    else:
+        sorted_embeddings = embedding_model.encode(sorted_titles, batch_size=batch_size, show_progress_bar=True)
+
+    embeddings = np.empty_like(sorted_embeddings)
+    embeddings[order] = sorted_embeddings
+    return embeddings
+
+
 def get_top_words_per_cluster(tfidf_matrix, num_clusters, clusters, feature_names, top_n=10):
     """
     Extracts the top N words with the highest average TF-IDF scores for each cluster.
@@ -55,104 +239,198 @@ def get_top_words_per_cluster(tfidf_matrix, num_clusters, clusters, feature_name
     :param top_n: The number of top words to retrieve per cluster. Default is 10.
     :return: A dictionary where the keys are cluster labels and the values are lists of the top N words representing each cluster.
     """
+    clusters = np.asarray(clusters)
+    tfidf_matrix = sparse.csr_matrix(tfidf_matrix)
+
+    # compute avg TF-IDF per word for all clusters at once: a sparse (cluster x product) indicator matrix, weighted by
+    # 1 / cluster size, multiplied by the (product x word) TF-IDF matrix
+    cluster_sizes = np.bincount(clusters, minlength=num_clusters)
+    indicator = sparse.csr_matrix((1.0 / cluster_sizes[clusters], (clusters, np.arange(len(clusters)))),
+                                  shape=(num_clusters, tfidf_matrix.shape[0]))
+    cluster_tfidf = (indicator @ tfidf_matrix).tocsr()
+
     cluster_keywords = {}
-    for cluster in tqdm(range(num_clusters), desc="Processing Clusters"):
-        # get indices of items in this cluster
-        cluster_indices = np.where(clusters == cluster)[0]
-        # compute avg TF-IDF per word
-        cluster_tfidf = np.mean(tfidf_matrix[cluster_indices].toarray(), axis=0)
-        # get top N words
-        top_n_idx = cluster_tfidf.argsort()[-top_n:][::-1]
-        cols = []
-        for i in top_n_idx:
-            cols.append(feature_names[i])
-        cluster_keywords[cluster] = cols
+    for cluster in range(num_clusters):
+        start, end = cluster_tfidf.indptr[cluster], cluster_tfidf.indptr[cluster + 1]
+        if end - start < top_n:
+            # fewer non-zero words than top_n, rank the dense row so the zero-score words are picked as before
+            top_n_idx = cluster_tfidf[cluster].toarray().ravel().argsort()[-top_n:][::-1]
+        else:
+            # get top N words among the non-zero entries of the cluster row
+            scores, words = cluster_tfidf.data[start:end], cluster_tfidf.indices[start:end]
+            top = np.argpartition(scores, -top_n)[-top_n:]
+            top_n_idx = words[top[np.lexsort((words[top], -scores[top]))]]
+        cluster_keywords[cluster] = [feature_names[i] for i in top_n_idx]
     return cluster_keywords
 
 
-def save_cluster_content(num_clusters, clusters, features, top_n=10):
+def fit_tfidf(features):
+    """
+    Fit a TF-IDF vectorizer on the lemmatized titles. The matrix only depends on the titles, so it is computed once and
+    shared by every number of clusters in the sweep.
+
+    :param features: Lemmatized product title (that captures the customization features of the product).
+    :return: tuple of the sparse TF-IDF matrix and the feature names.
+    """
+    vectorizer = TfidfVectorizer()
+    tfidf_matrix = vectorizer.fit_transform(features)
+    return tfidf_matrix, vectorizer.get_feature_names_out()
+
+
+def save_cluster_content(num_clusters, clusters, tfidf_matrix, feature_names, top_n=10):
     """
     Processes the top N most representative words for each cluster using TF-IDF. Result is saved as CSV file.
     This function helps in understanding the defining characteristics of each cluster by identifying the top N most frequent words.
 
     :param num_clusters: Total number of clusters.
     :param clusters: A Numpy array containing the cluster label for each product.
-    :param features: Lemmatized product title (that captures the customization features of the product).
+    :param tfidf_matrix: A sparse matrix containing the TF-IDF scores of the lemmatized titles (see `fit_tfidf`).
+    :param feature_names: A list of words (feature names) extracted from the TF-IDF vectorizer.
     :param top_n: The number of top words to retrieve per cluster. Default is 10.
     :return: None
     """
-    vectorizer = TfidfVectorizer()
-    tfidf_matrix = vectorizer.fit_transform(features)
-    feature_names = vectorizer.get_feature_names_out()
-    top_words_per_cluster = get_top_words_per_cluster(tfidf_matrix, num_clusters, clusters, feature_names, top_n=10)
+    top_words_per_cluster = get_top_words_per_cluster(tfidf_matrix, num_clusters, clusters, feature_names, top_n=top_n)
     df_clusters = pd.DataFrame.from_dict(top_words_per_cluster, orient="index")
     os.makedirs("../data", exist_ok=True)
     df_clusters.to_csv(f"../data/top_words_for_{num_clusters}.csv")
 
 
+def train_kmeans(embeddings, num_clusters, num_iterations=20, batch_size=10000, silhouette_sample_size=10000,
+                 random_state=42):
+    """
+    Train MiniBatchKMeans on random batches of the embeddings and score the result.
+    The result only depends on `random_state`, so candidates trained in parallel are reproducible regardless of order.
+
+    :param embeddings: Numpy array of title embeddings.
+    :param num_clusters: Number of clusters.
+    :param num_iterations: Number of `partial_fit` batches.
+    :param batch_size: Number of embeddings per batch.
+    :param silhouette_sample_size: Number of embeddings sampled to compute the silhouette score.
+    :param random_state: Seed for batch sampling, centroid initialisation and silhouette sampling.
+    :return: tuple of the fitted model, the cluster label of each embedding and a dictionary of quality scores
+             (inertia, lower is better; silhouette, higher is better).
+    """
+    rng = np.random.RandomState(random_state)
+    kmeans = MiniBatchKMeans(n_clusters=num_clusters, batch_size=batch_size, random_state=random_state, n_init=1)
+
+    # train in batches
+    batch_size = min(batch_size, embeddings.shape[0])
+    for _ in range(num_iterations):
+        batch = embeddings[rng.choice(embeddings.shape[0], batch_size, replace=False)]
+        kmeans.partial_fit(batch)
+
+    # assign final cluster labels and score the clustering
+    cluster_labels = kmeans.predict(embeddings)
+    inertia = -kmeans.score(embeddings)
+    silhouette = silhouette_score(embeddings, cluster_labels,
+                                  sample_size=min(silhouette_sample_size, embeddings.shape[0]),
+                                  random_state=random_state)
+    return kmeans, cluster_labels, {"num_clusters": num_clusters, "inertia": inertia, "silhouette": silhouette}
+
+
+def sweep_num_clusters(embeddings, cluster_range, n_jobs=-1, random_state=42, **kwargs):
+    """
+    Train one MiniBatchKMeans candidate per number of clusters in parallel worker processes.
+    The embeddings are shared with the workers through a memory map instead of being copied to each of them.
+    Each candidate is seeded from `random_state` and its number of clusters, so candidates draw independent batches
+    and the seed of a candidate does not change when others are added to or removed from `cluster_range`.
+
+    :param embeddings: Numpy array of title embeddings.
+    :param cluster_range: List of numbers of clusters to try.
+    :param n_jobs: Number of worker processes. -1 uses one process per candidate, up to the number of CPU cores.
+    :param random_state: Base seed of the sweep.
+    :param kwargs: Extra arguments passed to `train_kmeans`.
+    :return: tuple of a dictionary {num_clusters: (model, cluster labels)} and a DataFrame of scores per candidate.
+    """
+    n_jobs = min(len(cluster_range), os.cpu_count() or 1) if n_jobs == -1 else n_jobs
+    seeds = {num_clusters: int(np.random.SeedSequence([random_state, num_clusters]).generate_state(1)[0])
+             for num_clusters in cluster_range}
+    results = Parallel(n_jobs=n_jobs, max_nbytes="1M")(
+        delayed(train_kmeans)(embeddings, num_clusters, random_state=seeds[num_clusters], **kwargs)
+        for num_clusters in tqdm(cluster_range, desc="MiniBatchKMeans Training"))
+    models = {scores["num_clusters"]: (kmeans, labels) for kmeans, labels, scores in results}
+    df_scores = pd.DataFrame([scores for _, _, scores in results])
+    return models, df_scores
+
+
+def select_num_clusters(df_scores, metric="silhouette"):
+    """
+    Pick the number of clusters with the best quality score from the sweep.
+
+    :param df_scores: DataFrame of scores per candidate, from `sweep_num_clusters`.
+    :param metric: "silhouette" picks the highest sampled silhouette score. "inertia" picks the elbow of the inertia
+                   curve, i.e. the candidate after which adding clusters gives the smallest drop in inertia per cluster.
+    :return: The selected number of clusters.
+    """
+    df_scores = df_scores.sort_values("num_clusters").reset_index(drop=True)
+    if metric == "silhouette":
+        return int(df_scores.loc[df_scores["silhouette"].idxmax(), "num_clusters"])
+    if metric == "inertia":
+        if len(df_scores) < 3:
+            return int(df_scores["num_clusters"].iloc[-1])
+        drop_per_cluster = -df_scores["inertia"].diff() / df_scores["num_clusters"].diff()
+        # elbow: largest decrease in the marginal gain of adding clusters
+        elbow = drop_per_cluster.diff(-1).iloc[1:-1].idxmax()
+        return int(df_scores.loc[elbow, "num_clusters"])
+    raise ValueError(f"Unknown metric: {metric}")
+
+
 if __name__ == "__main__":
-    # load raw_data
-    logging.info("Loading raw_data")
-    df_meta = pd.read_json("../../raw_data/meta_Amazon_Fashion.jsonl", lines=True)
-
-    # select columns needed
-    useful_columns = ['title', 'average_rating', 'parent_asin']
-    df_meta = df_meta[useful_columns]
-
-    # remove NAs and duplications
-    logging.info("Cleaning raw_data")
-    df_meta.dropna(subset=['title'], inplace=True)
-    df_meta.dropna(subset=['parent_asin'], inplace=True)
-    df_meta = df_meta.drop_duplicates(subset=['parent_asin'])
-    df_meta = df_meta.reset_index(drop=True)
-
-    logging.info("Dropping rows with non-english titles")
-    # remove rows with non-english title for simplicity
-    df_meta = df_meta[df_meta['title'].progress_apply(lambda x: x.isascii())].reset_index(drop=True)
+    # load raw_data in chunks, keeping only the columns needed and dropping NAs, duplicates and non-english titles
+    logging.info("Loading and cleaning raw_data")
+    df_meta = load_metadata("../../raw_data/meta_Amazon_Fashion.jsonl", chunk_size=100000)
+
     logging.info("Basic text cleaning for titles")
     # text cleaning
-    df_meta['title_cleaned'] = df_meta['title'].progress_apply(clean)
+    df_meta['title_cleaned'] = clean_titles(df_meta['title'])
 
-    # lemmatize title (for each cluster's visualisation purpose only)
+    # lemmatize title (for each cluster's visualisation purpose only), each unique token is lemmatized once and cached
     logging.info("Lemmatize title for visualisation")
     lemmatizer = WordNetLemmatizer()
-    df_meta['title_lemma'] = df_meta['title_cleaned'].progress_apply(lambda x: lemmatize_sentence(lemmatizer, x))
+    df_meta['title_lemma'] = lemmatize_titles(lemmatizer, df_meta['title_cleaned'],
+                                              cache_path=os.path.join(CACHE_DIR, "lemma_cache.json"))
 
-    # generate embeddings
+    # generate embeddings, only titles not already in the on-disk embedding store are encoded
     logging.info("Generating embeddings")
-    embedding_model = SentenceTransformer("paraphrase-MiniLM-L3-v2")
-    embeddings = embedding_model.encode(df_meta['title'], show_progress_bar=True)
+    # set backend to "onnx" to use the int8-quantized ONNX export of the model
+    encode_batch_size, encode_workers, encode_backend = 256, os.cpu_count(), "torch"
+    embedding_model = load_embedding_model(EMBEDDING_MODEL, backend=encode_backend)
+    encoder = encoder_variant(encode_backend)
+    embedding_store = EmbeddingStore(store_dir(CACHE_DIR, encoder), EMBEDDING_MODEL, encoder)
+    embeddings = embedding_store.encode(
+        df_meta['title'],
+        lambda titles: encode_titles(embedding_model, titles, batch_size=encode_batch_size, num_workers=encode_workers))
 
-    # clustering using MiniBatchKMeans
-    logging.info("initialise MiniBatchKMeans")
+    # clustering using MiniBatchKMeans, one candidate per number of clusters trained in parallel
+    logging.info("MiniBatchKMeans sweep over number of clusters")
     num_iterations, batch_size = 20, 10000
     cluster_range = [100, 150, 200]
+    models, df_scores = sweep_num_clusters(embeddings, cluster_range, num_iterations=num_iterations,
+                                           batch_size=batch_size)
+    print(df_scores)
 
-    # for num_clusters in cluster_range:
-    for num_clusters in cluster_range:
-        kmeans = MiniBatchKMeans(n_clusters=num_clusters, batch_size=batch_size, random_state=42, n_init=1)
+    # the TF-IDF matrix only depends on the titles, so it is fitted once for all numbers of clusters
+    logging.info("Save the content of each cluster")
+    tfidf_matrix, feature_names = fit_tfidf(df_meta['title_lemma'])
+    os.makedirs("../data", exist_ok=True)
+    df_scores.to_csv("../data/cluster_sweep_scores.csv", index=False)
+    for num_clusters, (kmeans, cluster_labels) in models.items():
+        # use lemmatized title to check content of each cluster
+        save_cluster_content(num_clusters, cluster_labels, tfidf_matrix, feature_names, top_n=10)
 
-        # train in batches
-        with tqdm(total=num_iterations, desc=f"MiniBatchMeans Training for {num_clusters} clusters") as pbar:
-            for _ in range(num_iterations):
-                batch = embeddings[np.random.choice(embeddings.shape[0], batch_size, replace=False)]
-                kmeans.partial_fit(batch)
-                pbar.update(1)
+        # only the labels differ between candidates, so only parent_asin and the label column are saved per candidate
+        write_table(pd.DataFrame({'parent_asin': df_meta['parent_asin'], 'cluster_label': cluster_labels}),
+                    f"../data/cluster_labels_{num_clusters}")
 
-        # assign final cluster labels
-        cluster_labels = kmeans.predict(embeddings)
-        df_meta['cluster_label'] = cluster_labels
+    # pick the number of clusters with the best quality score instead of the fixed N=150 of the report,
+    # set best_num_cluster to override (e.g. best_num_cluster = 150)
+    best_num_cluster = select_num_clusters(df_scores, metric="silhouette")
+    logging.info(f"Selected {best_num_cluster} clusters")
 
-        # use lemmatized title to check content of each cluster
-        save_cluster_content(num_clusters, cluster_labels, df_meta['title_lemma'], top_n=10)
-
-        logging.info("Save the processed raw_data")
-        os.makedirs("../data", exist_ok=True)
-        output_path = os.path.abspath(f"../data/cleaned_metadata_{num_clusters}_clusters.csv")
-        df_meta.to_csv(output_path, index=False)
-
-    # after checking the best number of clusters, i.e. N=150, clean the final metadata df and save
-    best_num_cluster = 150
-    final_df = pd.read_csv(f"../data/cleaned_metadata_{best_num_cluster}_clusters.csv")
-    final_df.drop(['title_cleaned', 'title_lemma'], axis=1, inplace=True)
-    final_df.to_csv(f"../data/metadata.csv", index=False)
+    logging.info("Save the processed raw_data")
+    final_df = df_meta[META_COLUMNS].copy()
+    final_df['cluster_label'] = models[best_num_cluster][1]
+    write_table(final_df, "../data/metadata")
+
+    # save the selected clustering so new products can be labelled with assign_clusters.py
+    save_cluster_model(models[best_num_cluster][0], CLUSTER_MODEL_PATH, EMBEDDING_MODEL)
@@ -1,7 +1,16 @@
+import hashlib
 import os
 import pandas as pd
 import re
+from concurrent.futures import ProcessPoolExecutor
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+from group_b.data_io import write_table
+
+URL_PATTERN = r'http\S+|www\S+|https\S+'
+CACHE_DIR = "../data/cache"
+
+# analyzer used by get_vader_sentiment, created on first use in each process
+analyzer = None
 
 
 def remove_url(text: str) -> str:
@@ -11,8 +20,17 @@ def remove_url(text: str) -> str:
     :param text: Review text
     :return: Cleaned review text
     """
-    url_pattern = r'http\S+|www\S+|https\S+'
-    return re.sub(url_pattern, '', text)
+    return re.sub(URL_PATTERN, '', text)
+
+
+def remove_urls(reviews: pd.Series) -> pd.Series:
+    """
+    Vectorized version of `remove_url` for a whole column of reviews.
+
+    :param reviews: Series of review texts
+    :return: Series of cleaned review texts
+    """
+    return reviews.str.replace(URL_PATTERN, '', regex=True)
 
 
 def get_vader_sentiment(text):
@@ -22,10 +40,84 @@ def get_vader_sentiment(text):
     :param text: Review text.
     :return: Sentiment score range from 1 to 5, round to 1 decimal place.
     """
+    if analyzer is None:
+        _init_analyzer()
     sentiment = analyzer.polarity_scores(text)
     return round(sentiment['compound'] * 2 + 3, 1)
 
 
+def _init_analyzer():
+    """
+    Create the VADER analyzer of the current process (the main process or a worker).
+    """
+    global analyzer
+    analyzer = SentimentIntensityAnalyzer()
+
+
+def _score_batch(texts):
+    """
+    Score a batch of review texts in a worker process.
+    """
+    return [get_vader_sentiment(text) for text in texts]
+
+
+def review_hash(text: str) -> str:
+    """
+    Content hash used as the key of a review text in the sentiment cache.
+
+    :param text: Review text.
+    :return: Hex digest of the review text.
+    """
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def load_sentiment_cache(cache_path: str) -> pd.Series:
+    """
+    Load the sentiment scores computed by previous runs.
+
+    :param cache_path: Path to the csv sentiment cache.
+    :return: Series of sentiment scores indexed by review hash. Empty if no cache exists yet.
+    """
+    if not os.path.exists(cache_path):
+        return pd.Series(dtype=float, name="sentiment_score")
+    df_cache = pd.read_csv(cache_path, dtype={"review_hash": str})
+    # concurrent or interrupted runs can append the same review twice, its score is the same
+    df_cache = df_cache.drop_duplicates(subset=["review_hash"], keep="last")
+    return df_cache.set_index("review_hash")["sentiment_score"]
+
+
+def score_reviews(reviews: pd.Series, n_jobs: int = None, batch_size: int = 10000, cache_path: str = None) -> pd.Series:
+    """
+    Compute the 1 to 5 VADER sentiment score of each review, in parallel worker processes.
+    Reviews are keyed by a hash of their text. Only reviews that are not in the cache at `cache_path` are scored, and
+    new scores are appended to the cache, so reruns only score new reviews.
+
+    :param reviews: Series of review texts.
+    :param n_jobs: Number of worker processes, each with its own analyzer. Default is the number of CPU cores.
+    :param batch_size: Number of reviews sent to a worker at a time.
+    :param cache_path: Path to the csv sentiment cache. If None, no cache is used.
+    :return: Series of sentiment scores aligned with `reviews`.
+    """
+    hashes = reviews.map(review_hash)
+    cache = load_sentiment_cache(cache_path) if cache_path else pd.Series(dtype=float, name="sentiment_score")
+
+    df_new = pd.DataFrame({"review_hash": hashes, "review": reviews}).drop_duplicates(subset=["review_hash"])
+    df_new = df_new[~df_new["review_hash"].isin(cache.index)]
+    if not df_new.empty:
+        texts = df_new["review"].tolist()
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_analyzer) as executor:
+            scores = [score for batch in executor.map(_score_batch, batches) for score in batch]
+        df_new["sentiment_score"] = scores
+        df_new = df_new[["review_hash", "sentiment_score"]]
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            df_new.to_csv(cache_path, mode="a", index=False, header=not os.path.exists(cache_path))
+        cache = pd.concat([cache, df_new.set_index("review_hash")["sentiment_score"]])
+
+    return hashes.map(cache).rename("sentiment_score")
+
+
 if __name__ == "__main__":
     # Load raw_data and select columns
     df_review = pd.read_json("../../raw_data/Amazon_Fashion.jsonl", lines=True)
@@ -42,19 +134,18 @@ if __name__ == "__main__":
     # Combine title and text into a new column
     df_review['review'] = df_review['title'] + " " + df_review['text']
 
-    # Drop NAs, duplications and unnecessary columns
+    # Drop NAs, duplications and unnecessary columns (timestamp is kept for incremental refreshes downstream)
     df_review.dropna(subset=['parent_asin'], inplace=True)
     df_review = df_review.drop_duplicates(subset=['title', 'text', 'parent_asin'])
-    df_review.drop(columns=['verified_purchase', 'timestamp', 'title', 'text'], inplace=True)
+    df_review.drop(columns=['verified_purchase', 'title', 'text'], inplace=True)
 
     # Remove links in review
-    df_review['review'] = df_review['review'].apply(remove_url)
+    df_review['review'] = remove_urls(df_review['review'])
 
-    # Use Vader Sentiment pretrained model to calculate a sentiment score from 1 to 5
-    analyzer = SentimentIntensityAnalyzer()
-    df_review['sentiment_score'] = df_review['review'].apply(get_vader_sentiment)
+    # Use Vader Sentiment pretrained model to calculate a sentiment score from 1 to 5, in parallel and cached by review
+    df_review['sentiment_score'] = score_reviews(df_review['review'],
+                                                 cache_path=os.path.join(CACHE_DIR, "sentiment_cache.csv"))
     print(df_review.head())
 
-    # Save the data into csv
-    os.makedirs("../data", exist_ok=True)
-    df_review.to_csv("../data/review.csv", index=False)
+    # Save the data as parquet (or the format set by GROUP_B_DATA_FORMAT)
+    write_table(df_review, "../data/review")
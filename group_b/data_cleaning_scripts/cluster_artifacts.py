@@ -0,0 +1,49 @@
+import os
+
+import joblib
+import pandas as pd
+
+# Settings and artifacts shared by the clustering (`clean_metadata.py`) and the assignment of new products
+# (`assign_clusters.py`). Kept free of the embedding and NLP dependencies so the assignment API imports quickly.
+META_COLUMNS = ['title', 'average_rating', 'parent_asin']
+CACHE_DIR = "../data/cache"
+EMBEDDING_MODEL = "paraphrase-MiniLM-L3-v2"
+CLUSTER_MODEL_PATH = "../data/cluster_model.joblib"
+ONNX_FILE = "onnx/model_qint8_avx2.onnx"
+
+
+def encoder_variant(backend: str = "torch", onnx_file: str = ONNX_FILE) -> str:
+    """
+    Identity of the encoder loaded by `clean_metadata.load_embedding_model`, used to keep embeddings of different
+    backends and ONNX exports in separate embedding stores.
+
+    :param backend: "torch" or "onnx".
+    :param onnx_file: ONNX file of the model when backend is "onnx".
+    :return: "torch", or "onnx:<onnx_file>".
+    """
+    if backend == "onnx":
+        return f"onnx:{onnx_file}"
+    return "torch"
+
+
+def save_cluster_model(kmeans, path=CLUSTER_MODEL_PATH, model_name=EMBEDDING_MODEL, version=None):
+    """
+    Persist the fitted clustering together with the embedding model it was trained on, so that new products can be
+    assigned to the frozen centroids later without rerunning `clean_metadata.py` (see `assign_clusters.py`).
+
+    :param kmeans: Fitted MiniBatchKMeans model.
+    :param path: Path of the joblib artifact.
+    :param model_name: Name of the SentenceTransformer model used to embed the titles.
+    :param version: Version tag of the artifact. Default is the current UTC timestamp.
+    :return: None
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    artifact = {
+        "kmeans": kmeans,
+        "embedding_model": model_name,
+        "num_clusters": int(kmeans.n_clusters),
+        "version": version or pd.Timestamp.now(tz="UTC").strftime("%Y%m%dT%H%M%SZ"),
+    }
+    tmp_path = f"{path}.tmp"
+    joblib.dump(artifact, tmp_path)
+    os.replace(tmp_path, path)
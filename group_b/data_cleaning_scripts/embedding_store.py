@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+
+def title_hash(title: str) -> str:
+    """
+    Content hash used as the key of a product title in the embedding store.
+
+    :param title: Product title.
+    :return: Hex digest of the title.
+    """
+    return hashlib.blake2b(title.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def store_dir(cache_dir: str, encoder: str = "torch") -> str:
+    """
+    Directory of the embedding store of an encoder variant, so that embeddings of different variants are never mixed.
+
+    :param cache_dir: Cache directory.
+    :param encoder: Encoder variant, see `cluster_artifacts.encoder_variant`.
+    :return: Path of the store directory. The default pytorch encoder keeps the original `embeddings` directory.
+    """
+    if encoder == "torch":
+        return os.path.join(cache_dir, "embeddings")
+    return os.path.join(cache_dir, "embeddings_" + re.sub(r"[^\w.-]", "_", encoder))
+
+
+class EmbeddingStore:
+    """
+    Content-addressed, append-only store of title embeddings on disk.
+    The store is a directory containing:
+    - `meta.json`: the embedding model name, encoder variant and embedding dimension the store was built with.
+    - `embeddings.f16`: a raw float16 matrix of shape (n, dim), read back with `np.memmap` so that lookups do not load
+      the whole matrix in memory.
+    - `index.txt`: one title hash per line, where line i is the key of row i in `embeddings.f16`.
+
+    Appends write the embeddings first and the hashes second, and rows are only visible once both are on disk, so an
+    interrupted append never exposes a partially written row. The store assumes a single writer at a time; any number
+    of readers (e.g. later consumers of the embeddings) can open it concurrently.
+
+    :param root: Directory of the store. Created if it does not exist.
+    :param model_name: Name of the embedding model. Opening an existing store with a different model raises an error.
+    :param encoder: Encoder variant of the model, e.g. "torch" or "onnx:onnx/model_qint8_avx2.onnx" (see
+                    `cluster_artifacts.encoder_variant`). Quantized and full precision embeddings differ slightly, so
+                    opening an existing store with a different variant raises an error as well.
+    """
+
+    def __init__(self, root: str, model_name: str, encoder: str = "torch"):
+        self.root = root
+        self.model_name = model_name
+        self.encoder = encoder
+        self.meta_path = os.path.join(root, "meta.json")
+        self.data_path = os.path.join(root, "embeddings.f16")
+        self.index_path = os.path.join(root, "index.txt")
+        os.makedirs(root, exist_ok=True)
+
+        self.dim = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+            if meta["model_name"] != model_name:
+                raise ValueError(f"Embedding store at {root} was built with {meta['model_name']}, not {model_name}")
+            if meta.get("encoder") != encoder:
+                # stores written before the encoder was recorded may hold embeddings of any variant
+                raise ValueError(f"Embedding store at {root} was built with encoder {meta.get('encoder', 'unknown')}, "
+                                 f"not {encoder}; delete it to rebuild the store")
+            self.dim = meta["dim"]
+        self._load_index()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, title: str):
+        return title_hash(title) in self.row_of
+
+    def _row_bytes(self):
+        return self.dim * np.dtype(np.float16).itemsize
+
+    def _load_index(self):
+        """
+        Read the hash -> row index, ignoring rows whose embedding or hash was not completely written.
+        """
+        keys = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                keys = [line.rstrip("\n") for line in f if line.endswith("\n")]
+        if self.dim is not None and os.path.exists(self.data_path):
+            keys = keys[:os.path.getsize(self.data_path) // self._row_bytes()]
+        else:
+            keys = []
+        self.keys = keys
+        self.row_of = {key: row for row, key in enumerate(keys)}
+
+    def _embeddings(self):
+        """
+        Memory-map the committed rows of the embedding matrix.
+        """
+        if not self.keys:
+            return np.empty((0, self.dim or 0), dtype=np.float16)
+        return np.memmap(self.data_path, dtype=np.float16, mode="r", shape=(len(self.keys), self.dim))
+
+    def lookup(self, titles) -> np.ndarray:
+        """
+        Find the row of each title in the store.
+
+        :param titles: Iterable of product titles.
+        :return: Numpy array of row numbers, -1 for titles that are not in the store.
+        """
+        return np.array([self.row_of.get(title_hash(title), -1) for title in titles], dtype=np.int64)
+
+    def get(self, titles) -> np.ndarray:
+        """
+        Read the embeddings of titles that are already in the store.
+
+        :param titles: Iterable of product titles.
+        :return: float32 array of shape (len(titles), dim).
+        """
+        rows = self.lookup(titles)
+        if (rows < 0).any():
+            raise KeyError(f"{int((rows < 0).sum())} titles are not in the embedding store")
+        return np.asarray(self._embeddings()[rows], dtype=np.float32)
+
+    def append(self, titles, embeddings: np.ndarray):
+        """
+        Add new title embeddings to the store. Titles already in the store are skipped.
+
+        :param titles: List of product titles.
+        :param embeddings: Array of shape (len(titles), dim) with the embedding of each title.
+        :return: None
+        """
+        embeddings = np.asarray(embeddings)
+        if self.dim is None:
+            self.dim = int(embeddings.shape[1])
+            meta = {"model_name": self.model_name, "encoder": self.encoder, "dim": self.dim, "dtype": "float16"}
+            with open(self.meta_path, "w") as f:
+                json.dump(meta, f)
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of dimension {self.dim}, got {embeddings.shape[1]}")
+
+        keys, rows = [], []
+        for i, title in enumerate(titles):
+            key = title_hash(title)
+            if key not in self.row_of:
+                self.row_of[key] = len(self.keys) + len(keys)
+                keys.append(key)
+                rows.append(i)
+        if not keys:
+            return
+
+        # drop any partially written rows left by an interrupted append before writing new ones
+        committed_bytes = len(self.keys) * self._row_bytes()
+        with open(self.data_path, "ab") as f:
+            f.truncate(committed_bytes)
+            f.write(embeddings[rows].astype(np.float16).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index_path, "a") as f:
+            f.truncate(sum(len(key) + 1 for key in self.keys))
+            f.write("".join(f"{key}\n" for key in keys))
+        self.keys.extend(keys)
+
+    def encode(self, titles, encode_fn) -> np.ndarray:
+        """
+        Get the embeddings of all titles, encoding only the titles that are not in the store yet.
+
+        :param titles: Iterable of product titles.
+        :param encode_fn: Function that takes a list of titles and returns their embeddings,
+                          e.g. `lambda x: model.encode(x)`.
+        :return: float32 array of shape (len(titles), dim), in the same order as `titles`.
+        """
+        titles = pd.Series(titles).astype(str)
+        unique_titles = titles.drop_duplicates()
+        missing = unique_titles[self.lookup(unique_titles) < 0].tolist()
+        if missing:
+            self.append(missing, encode_fn(missing))
+        return self.get(titles)
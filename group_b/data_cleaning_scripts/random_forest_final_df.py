@@ -1,24 +1,162 @@
+import argparse
+import json
 import os
 
+import numpy as np
 import pandas as pd
 from itertools import product
+from tqdm import tqdm
+
+from group_b.data_io import iter_table, read_table, write_table
+
+KEYS = ["cluster_label", "year", "quarter"]
+ACCUMULATORS = ["num_sales", "sentiment_sum", "sentiment_count", "rating_sum", "rating_count"]
+REVIEW_COLUMNS = ["parent_asin", "year", "quarter", "review", "sentiment_score", "rating"]
+STATE_PATH = "../data/combined_dataset_state"
+WATERMARK_PATH = "../data/combined_dataset_watermark.json"
+
+
+def build_cluster_index(df_metadata):
+    """
+    Build a hash index from parent_asin to cluster label, used to label reviews without merging the two datasets.
+
+    :param df_metadata: Cleaned metadata with parent_asin and cluster_label columns.
+    :return: tuple of a pandas Index of parent_asin and a Numpy array of the cluster label at each position.
+    """
+    df_metadata = df_metadata.drop_duplicates(subset=["parent_asin"])
+    return pd.Index(df_metadata["parent_asin"]), df_metadata["cluster_label"].to_numpy()
+
+
+def aggregate_chunk(df_review, asin_index, asin_clusters):
+    """
+    Aggregate one chunk of reviews into running count/sum accumulators per (cluster_label, year, quarter).
+
+    :param df_review: Chunk of the cleaned review dataset.
+    :param asin_index: Index of parent_asin, from `build_cluster_index`.
+    :param asin_clusters: Cluster label of each parent_asin in `asin_index`.
+    :return: DataFrame indexed by (cluster_label, year, quarter) with the accumulator columns.
+    """
+    # map each review to its product's cluster, reviews of products without metadata are dropped
+    positions = asin_index.get_indexer(df_review["parent_asin"])
+    matched = positions >= 0
+    df_chunk = pd.DataFrame({
+        "cluster_label": asin_clusters[positions[matched]],
+        "year": df_review["year"].to_numpy()[matched],
+        "quarter": df_review["quarter"].to_numpy()[matched],
+        "num_sales": df_review["review"].notna().to_numpy()[matched],
+        "sentiment_sum": df_review["sentiment_score"].fillna(0).to_numpy()[matched],
+        "sentiment_count": df_review["sentiment_score"].notna().to_numpy()[matched],
+        "rating_sum": df_review["rating"].fillna(0).to_numpy()[matched],
+        "rating_count": df_review["rating"].notna().to_numpy()[matched],
+    })
+    return df_chunk.groupby(KEYS).sum()
+
+
+def review_keys(df_review):
+    """
+    Key of each review, a hash of the columns reviews are de-duplicated on in `clean_review.py`.
+
+    :param df_review: Review DataFrame with parent_asin and review columns.
+    :return: Numpy array of uint64 keys, stable across runs.
+    """
+    return pd.util.hash_pandas_object(df_review[["parent_asin", "review"]], index=False).to_numpy()
+
+
+def aggregate_reviews(review_chunks, asin_index, asin_clusters, totals=None, watermark=None, watermark_keys=None):
+    """
+    Stream review chunks and keep running count/sum accumulators per (cluster_label, year, quarter).
+    Memory scales with the number of clusters x quarters instead of the number of reviews.
+    Reviews at the watermark timestamp whose key is in `watermark_keys` were aggregated by the last run and are
+    skipped, so a refresh can read reviews at or after the watermark without counting any review twice.
+    Chunks are not sorted by time, so the incoming watermark and keys are used for the whole run, and the latest
+    timestamp and its keys are tracked separately and only returned at the end.
+
+    :param review_chunks: Iterable of review DataFrames (e.g. from `data_io.iter_table`).
+    :param asin_index: Index of parent_asin, from `build_cluster_index`.
+    :param asin_clusters: Cluster label of each parent_asin in `asin_index`.
+    :param totals: Accumulators of previously processed reviews to add the new reviews to, e.g. from `load_state`.
+    :param watermark: Latest review timestamp of the last run, e.g. from `load_state`.
+    :param watermark_keys: Keys (see `review_keys`) of the reviews at `watermark` aggregated by the last run.
+    :return: tuple of a DataFrame with cluster_label, year, quarter and the accumulator columns, the latest review
+             timestamp seen (None if the chunks have no timestamp column or no rows, and there is no previous
+             watermark) and the set of keys of the aggregated reviews at that timestamp.
+    """
+    if totals is None or totals.empty:
+        totals = pd.DataFrame(columns=KEYS + ACCUMULATORS)
+    totals = totals.set_index(KEYS)
+    seen_keys = np.fromiter(watermark_keys or (), dtype=np.uint64)
+    latest, latest_keys = None, set()
+    for df_review in tqdm(review_chunks, desc="Aggregating review chunks"):
+        if "timestamp" in df_review.columns and df_review["timestamp"].notna().any():
+            timestamps = pd.to_datetime(df_review["timestamp"])
+            if watermark is not None and len(seen_keys):
+                # drop the reviews at the watermark that were already aggregated by the last run
+                at_watermark = (timestamps == watermark).to_numpy()
+                seen = np.zeros(len(df_review), dtype=bool)
+                seen[at_watermark] = np.isin(review_keys(df_review[at_watermark]), seen_keys)
+                df_review, timestamps = df_review[~seen], timestamps[~seen]
+            if timestamps.notna().any():
+                chunk_max = timestamps.max()
+                keys = set(review_keys(df_review[(timestamps == chunk_max).to_numpy()]).tolist())
+                if latest is None or chunk_max > latest:
+                    latest, latest_keys = chunk_max, keys
+                elif chunk_max == latest:
+                    latest_keys |= keys
+        df_chunk = aggregate_chunk(df_review, asin_index, asin_clusters)
+        totals = df_chunk if totals.empty else totals.add(df_chunk, fill_value=0)
+    totals = totals.reset_index()
+    totals[KEYS + ["num_sales", "sentiment_count", "rating_count"]] = totals[
+        KEYS + ["num_sales", "sentiment_count", "rating_count"]].astype(int)
+
+    # advance the watermark only if this run saw later reviews, keys at an unchanged watermark accumulate
+    if latest is None or (watermark is not None and latest < watermark):
+        return totals, watermark, set(watermark_keys or ())
+    if watermark is not None and latest == watermark:
+        latest_keys |= set(watermark_keys or ())
+    return totals, latest, latest_keys
 
-if __name__ == "__main__":
-    # Load cleaned metadata and review datasets
-    df_final_metadata = pd.read_csv("../data/metadata.csv")
-    df_final_review = pd.read_csv("../data/review.csv")
 
-    df_combined = df_final_metadata.merge(df_final_review, on=["parent_asin"], how="left")
+def load_state(state_path=STATE_PATH, watermark_path=WATERMARK_PATH):
+    """
+    Load the accumulators and the watermark saved by the last run.
 
-    # Find min year,quarter and max year,quarter to build a full date table
-    min_year = int(df_combined["year"].min())
-    max_year = int(df_combined["year"].max())
-    min_quarter = int(df_combined.loc[df_combined["year"] == min_year, "quarter"].min())
-    max_quarter = int(df_combined.loc[df_combined["year"] == max_year, "quarter"].max())
+    :param state_path: Path to the accumulators dataset.
+    :param watermark_path: Path to the json file with the latest processed review timestamp.
+    :return: tuple of the accumulators DataFrame, the watermark timestamp and the keys of the reviews at the
+             watermark (None for watermarks saved without them, whose reviews at the watermark were all processed).
+    """
+    totals = read_table(state_path)
+    with open(watermark_path, "r") as f:
+        state = json.load(f)
+    keys = state.get("review_keys")
+    return totals, pd.Timestamp(state["timestamp"]), None if keys is None else {int(key) for key in keys}
 
+
+def save_state(totals, watermark, watermark_keys=(), state_path=STATE_PATH, watermark_path=WATERMARK_PATH):
+    """
+    Save the accumulators (sums and counts, so means can be merged exactly later) and the watermark.
+    The watermark is written last, so an interrupted save never advances it past the saved accumulators.
+
+    :param totals: Accumulators per (cluster_label, year, quarter).
+    :param watermark: Latest processed review timestamp.
+    :param watermark_keys: Keys of the processed reviews at the watermark timestamp, see `review_keys`.
+    :param state_path: Path to the accumulators dataset.
+    :param watermark_path: Path to the json file with the latest processed review timestamp.
+    :return: None
+    """
+    write_table(totals, state_path)
+    tmp_path = f"{watermark_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"timestamp": watermark.isoformat(), "review_keys": [str(key) for key in sorted(watermark_keys)]}, f)
+    os.replace(tmp_path, watermark_path)
+
+
+def quarter_range(min_year, min_quarter, max_year, max_quarter):
+    """
+    List every (year, quarter) from the first to the last quarter, both included.
+    """
     date_combinations = []
     year, quarter = min_year, min_quarter
-
     while (year < max_year) or (year == max_year and quarter <= max_quarter):
         date_combinations.append((year, quarter))
         if quarter == 4:
@@ -26,31 +164,75 @@ if __name__ == "__main__":
             quarter = 1
         else:
             quarter += 1
+    return date_combinations
 
-    full_date_table = pd.DataFrame(product(df_combined["cluster_label"].unique(), date_combinations),
-                                   columns=["cluster_label", "date"])
 
-    full_date_table[["year", "quarter"]] = pd.DataFrame(full_date_table["date"].tolist(), index=full_date_table.index)
-    full_date_table.drop(columns=["date"], inplace=True)
+def build_combined_dataset(totals, clusters, date_combinations=None):
+    """
+    Build the dense cluster x quarter table from the accumulators, with the mean sentiment and rating per quarter.
+    Quarters without reviews have 0 sales, sentiment and rating.
 
-    # Merge the full date table with aggregated data to ensure all (year, quarter) combinations exist
-    df_aggregated = df_combined.groupby(["cluster_label", "year", "quarter"]).agg({
-        "review": "count",
-        "sentiment_score": "mean",
-        "rating": "mean"
-    }).reset_index()
+    :param totals: Accumulators per (cluster_label, year, quarter), from `aggregate_reviews`.
+    :param clusters: All cluster labels, including clusters without reviews.
+    :param date_combinations: List of (year, quarter) of the calendar. Default is from the first to the last quarter
+                              with reviews.
+    :return: DataFrame with cluster_label, year, quarter, num_sales, sentiment_score and rating.
+    """
+    if date_combinations is None:
+        # Find min year,quarter and max year,quarter to build a full date table
+        min_year, max_year = int(totals["year"].min()), int(totals["year"].max())
+        min_quarter = int(totals.loc[totals["year"] == min_year, "quarter"].min())
+        max_quarter = int(totals.loc[totals["year"] == max_year, "quarter"].max())
+        date_combinations = quarter_range(min_year, min_quarter, max_year, max_quarter)
 
-    df_aggregated.rename(columns={"review": "num_sales"}, inplace=True)
+    full_date_table = pd.DataFrame([(cluster, year, quarter) for cluster, (year, quarter)
+                                    in product(clusters, date_combinations)], columns=KEYS)
+
+    # Merge the full date table with aggregated data to ensure all (year, quarter) combinations exist
+    df_aggregated = totals[KEYS].copy()
+    df_aggregated["num_sales"] = totals["num_sales"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        df_aggregated["sentiment_score"] = totals["sentiment_sum"] / totals["sentiment_count"]
+        df_aggregated["rating"] = totals["rating_sum"] / totals["rating_count"]
 
-    df_final = full_date_table.merge(df_aggregated, on=["cluster_label", "year", "quarter"], how="left")
+    df_final = full_date_table.merge(df_aggregated, on=KEYS, how="left")
     df_final.fillna(0, inplace=True)
     df_final["year"] = df_final["year"].astype(int)
     df_final["num_sales"] = df_final["num_sales"].astype(int)
     df_final["cluster_label"] = df_final["cluster_label"].astype("category")
-    df_final = df_final.sort_values(by=["cluster_label", "year", "quarter"])
+    return df_final.sort_values(by=KEYS).reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the cluster x quarter dataset used for demand forecasting.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only aggregate reviews not seen by the last run (at or after its watermark) and merge "
+                             "them into the saved sums and counts")
+    args = parser.parse_args()
+
+    # Load cleaned metadata and index parent_asin -> cluster_label
+    df_final_metadata = read_table("../data/metadata", columns=["parent_asin", "cluster_label"])
+    asin_index, asin_clusters = build_cluster_index(df_final_metadata)
+
+    totals, watermark, watermark_keys, filters = None, None, None, None
+    if args.incremental:
+        totals, watermark, watermark_keys = load_state()
+        # reviews at the watermark timestamp may arrive after the last run, they are read again and de-duplicated by
+        # key; watermarks saved without keys fall back to reviews strictly after the watermark
+        filters = [("timestamp", ">=" if watermark_keys is not None else ">", watermark)]
+        print(f"Aggregating reviews from {watermark}")
+
+    # Stream the cleaned reviews and aggregate them per cluster and quarter without joining the two datasets
+    review_chunks = iter_table("../data/review", columns=REVIEW_COLUMNS + ["timestamp"], batch_size=1000000,
+                               filters=filters)
+    totals, watermark, watermark_keys = aggregate_reviews(review_chunks, asin_index, asin_clusters, totals=totals,
+                                                          watermark=watermark, watermark_keys=watermark_keys)
+    if watermark is not None:
+        save_state(totals, watermark, watermark_keys)
+
+    df_final = build_combined_dataset(totals, df_final_metadata["cluster_label"].unique())
 
     print(df_final.head())
 
-    # save the final data into csv
-    os.makedirs("../data", exist_ok=True)
-    df_final.to_csv("../raw_data/data/final_combined_dataset.csv", index=False)
+    # save the final data as parquet (or the format set by GROUP_B_DATA_FORMAT), read by the demand scripts
+    write_table(df_final, "../data/combined_dataset")
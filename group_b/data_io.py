@@ -0,0 +1,195 @@
+import operator
+import os
+
+import pandas as pd
+
+# format used when a stage writes a dataset without an explicit extension: "parquet", "arrow" or "csv"
+DATA_FORMAT = os.environ.get("GROUP_B_DATA_FORMAT", "parquet")
+EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+
+_OPERATORS = {
+    "==": operator.eq, "=": operator.eq, "!=": operator.ne,
+    "<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+    "in": lambda col, values: col.isin(values), "not in": lambda col, values: ~col.isin(values),
+}
+
+
+def _format_of(path):
+    """
+    Return the format of a path from its extension, or None if it has no known extension.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".feather":
+        return "arrow"
+    return next((fmt for fmt, fmt_ext in EXTENSIONS.items() if fmt_ext == ext), None)
+
+
+def resolve_path(path):
+    """
+    Find the file of a dataset. A path without extension resolves to the most recently written file among the
+    parquet, arrow and csv versions of the dataset, so consumers keep working whichever format the producer wrote.
+
+    :param path: Path to the dataset, with or without extension.
+    :return: Path to an existing file.
+    """
+    if _format_of(path) is not None:
+        return path
+    candidates = [path + ext for ext in EXTENSIONS.values() if os.path.exists(path + ext)]
+    if not candidates:
+        raise FileNotFoundError(f"No parquet, arrow or csv file found for {path}")
+    return max(candidates, key=os.path.getmtime)
+
+
+def _apply_filters(df, filters):
+    """
+    Apply pyarrow-style filters to a DataFrame, for formats without predicate pushdown.
+    """
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        col = df[column]
+        if isinstance(value, pd.Timestamp) and not pd.api.types.is_datetime64_any_dtype(col):
+            col = pd.to_datetime(col)
+        mask &= _OPERATORS[op](col, value)
+    return df[mask].reset_index(drop=True)
+
+
+def read_table(path, columns=None, filters=None):
+    """
+    Read a dataset written by `write_table`.
+    For parquet files, only the requested columns are read, and filters are pushed down to the reader so row groups
+    that cannot match (e.g. other years or clusters) are skipped.
+
+    :param path: Path to the dataset, with or without extension (see `resolve_path`).
+    :param columns: List of columns to read. Default is all columns.
+    :param filters: List of (column, op, value) tuples that are all required to hold, e.g.
+                    [("year", ">=", 2012), ("cluster_label", "in", [1, 2])].
+                    Supported ops are ==, !=, <, <=, >, >=, in and not in.
+    :return: DataFrame.
+    """
+    path = resolve_path(path)
+    fmt = _format_of(path)
+    if fmt == "parquet":
+        return pd.read_parquet(path, columns=columns, filters=filters or None)
+
+    filter_columns = [column for column, _, _ in filters or []]
+    read_columns = None if columns is None else list(dict.fromkeys(list(columns) + filter_columns))
+    if fmt == "arrow":
+        df = pd.read_feather(path, columns=read_columns)
+    else:
+        df = pd.read_csv(path, usecols=read_columns)
+    if filters:
+        df = _apply_filters(df, filters)
+    return df if columns is None else df[list(columns)]
+
+
+def iter_table(path, columns=None, batch_size=1000000, filters=None):
+    """
+    Read a dataset in chunks of at most `batch_size` rows, so that memory depends on the chunk size instead of the
+    size of the dataset.
+
+    :param path: Path to the dataset, with or without extension (see `resolve_path`).
+    :param columns: List of columns to read. Default is all columns.
+    :param batch_size: Maximum number of rows per chunk.
+    :param filters: List of (column, op, value) tuples, see `read_table`. Pushed down to the reader for parquet.
+    :return: Generator of DataFrames.
+    """
+    path = resolve_path(path)
+    fmt = _format_of(path)
+    if fmt == "parquet":
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+        expression = pq.filters_to_expression(filters) if filters else None
+        for batch in ds.dataset(path, format="parquet").to_batches(columns=columns, filter=expression,
+                                                                    batch_size=batch_size):
+            if batch.num_rows:
+                yield batch.to_pandas()
+        return
+
+    filter_columns = [column for column, _, _ in filters or []]
+    read_columns = None if columns is None else list(dict.fromkeys(list(columns) + filter_columns))
+    for chunk in _iter_unfiltered(path, fmt, read_columns, batch_size):
+        if filters:
+            chunk = _apply_filters(chunk, filters)
+        yield chunk if columns is None else chunk[list(columns)]
+
+
+def _iter_unfiltered(path, fmt, columns, batch_size):
+    """
+    Read an arrow or csv dataset in chunks, see `iter_table`.
+    """
+    if fmt == "arrow":
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                batch = batch if columns is None else batch.select(columns)
+                for start in range(0, batch.num_rows, batch_size):
+                    yield batch.slice(start, batch_size).to_pandas()
+    else:
+        with pd.read_csv(path, usecols=columns, chunksize=batch_size) as reader:
+            yield from reader
+
+
+def write_table(df, path, fmt=None):
+    """
+    Write a dataset as typed, compressed parquet (zstd), arrow IPC (zstd) or csv.
+
+    :param df: DataFrame to save. The index is not saved.
+    :param path: Path to the dataset. If it has no extension, the extension of `fmt` is added.
+    :param fmt: "parquet", "arrow" or "csv". Default is the path's extension, or DATA_FORMAT if it has none.
+    :return: Path of the written file.
+    """
+    fmt = fmt or _format_of(path) or DATA_FORMAT
+    if _format_of(path) is None:
+        path = path + EXTENSIONS[fmt]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    df = df.reset_index(drop=True)
+    if fmt == "parquet":
+        df.to_parquet(path, index=False, compression="zstd")
+    elif fmt == "arrow":
+        df.to_feather(path, compression="zstd")
+    elif fmt == "csv":
+        df.to_csv(path, index=False)
+    else:
+        raise ValueError(f"Unknown data format: {fmt}")
+    return path
+
+
+def file_version(path):
+    """
+    Version of a file for `ProcessCache`: its modification time in nanoseconds.
+
+    :param path: Path to an existing file.
+    :return: Modification time of the file.
+    """
+    return os.stat(path).st_mtime_ns
+
+
+class ProcessCache:
+    """
+    Values loaded once per process and reloaded only when their version changes, e.g. the modification time of the
+    file they were read from (see `file_version`) or a model version. Only the latest version of each key is kept, so
+    an updated file or a newly published model replaces the previous value in memory instead of adding to it.
+    """
+
+    def __init__(self):
+        self._entries = {}
+
+    def get(self, key, version, load):
+        """
+        Get the cached value of a key, loading it if it is missing or its version changed.
+
+        :param key: Key of the value, e.g. a path.
+        :param version: Current version of the value.
+        :param load: Function without arguments that loads the value.
+        :return: The value.
+        """
+        cached = self._entries.get(key)
+        if cached is None or cached[0] != version:
+            cached = (version, load())
+            self._entries[key] = cached
+        return cached[1]
+
+    def clear(self):
+        self._entries.clear()
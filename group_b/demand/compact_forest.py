@@ -0,0 +1,216 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from group_b.data_io import ProcessCache
+from group_b.demand.model_registry import REGISTRY_DIR, get_latest_version, load_model
+
+COMPACT_DIR = "compact"
+NODE_ARRAYS = ["feature", "threshold", "left", "right", "value", "roots"]
+
+# predictors loaded in this process (CompactForest or model), by (registry_dir, name) and versioned by model version
+_loaded_predictors = ProcessCache()
+
+
+class CompactForest:
+    """
+    Random forest flattened into a few contiguous node arrays, for fast, low-memory inference.
+    The nodes of all trees are stored back to back:
+    - `feature` (int32): feature compared at each node, 0 at leaves.
+    - `threshold` (float32): the node goes left when the feature value is <= the threshold.
+    - `left`, `right` (int32): global index of the children, leaves point to themselves.
+    - `value` (float32): prediction of the node, only used at leaves.
+    - `roots` (int32): index of the root node of each tree.
+
+    All rows and trees are traversed together with Numpy, one tree level per step, so a prediction costs a few array
+    operations per level instead of one Python call per tree, and (tree, row) pairs stop being processed once they
+    reach a leaf. Saved arrays are plain .npy files that are loaded with `mmap_mode="r"`, so every worker process
+    shares the same pages of the forest.
+
+    :param arrays: Dictionary of the node arrays, see above.
+    :param feature_names: Feature names in the order the forest was trained on.
+    :param max_depth: Maximum depth of the trees, the number of traversal steps.
+    """
+
+    def __init__(self, arrays, feature_names, max_depth):
+        self.arrays = arrays
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.max_depth = int(max_depth)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """
+        Flatten a fitted RandomForestRegressor (or any forest of single-output regression trees).
+
+        :param model: Fitted forest.
+        :return: CompactForest.
+        """
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset, max_depth = 0, 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            is_leaf = tree.children_left < 0
+            node_ids = np.arange(tree.node_count)
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            # sklearn compares float32 inputs with float64 thresholds, rounding the threshold down to float32 keeps
+            # every comparison identical
+            threshold = tree.threshold.astype(np.float32)
+            too_high = threshold.astype(np.float64) > tree.threshold
+            threshold[too_high] = np.nextafter(threshold[too_high], np.float32(-np.inf))
+            thresholds.append(threshold)
+            lefts.append((np.where(is_leaf, node_ids, tree.children_left) + offset).astype(np.int32))
+            rights.append((np.where(is_leaf, node_ids, tree.children_right) + offset).astype(np.int32))
+            values.append(tree.value[:, 0, 0].astype(np.float32))
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        arrays = {
+            "feature": np.concatenate(features), "threshold": np.concatenate(thresholds),
+            "left": np.concatenate(lefts), "right": np.concatenate(rights),
+            "value": np.concatenate(values), "roots": np.asarray(roots, dtype=np.int32),
+        }
+        return cls(arrays, getattr(model, "feature_names_in_", None), max_depth)
+
+    @property
+    def n_trees(self):
+        return len(self.arrays["roots"])
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def predict(self, X):
+        """
+        Predict with the mean of all trees, like RandomForestRegressor.predict.
+
+        :param X: DataFrame (columns are reordered to the training order) or array of features.
+        :return: Numpy array of predictions.
+        """
+        if isinstance(X, pd.DataFrame) and self.feature_names is not None:
+            X = X[self.feature_names]
+        X = np.asarray(X, dtype=np.float32)
+        feature, threshold = self.arrays["feature"], self.arrays["threshold"]
+        left, right = self.arrays["left"], self.arrays["right"]
+
+        # one (tree, row) pair per position, grouped by tree so that lookups stay within the nodes of one tree,
+        # pairs that reached a leaf are dropped from the active set
+        nodes = np.repeat(self.arrays["roots"], len(X))
+        rows = np.tile(np.arange(len(X), dtype=np.int32), self.n_trees)
+        active = np.flatnonzero(left[nodes] != nodes)
+        for _ in range(self.max_depth):
+            if active.size == 0:
+                break
+            current = nodes[active]
+            go_left = X[rows[active], feature[current]] <= threshold[current]
+            nodes[active] = next_nodes = np.where(go_left, left[current], right[current])
+            active = active[left[next_nodes] != next_nodes]
+        return self.arrays["value"][nodes].astype(np.float64).reshape(self.n_trees, len(X)).mean(axis=0)
+
+    def save(self, path):
+        """
+        Save the node arrays as .npy files in a directory.
+
+        :param path: Directory to save to.
+        :return: None
+        """
+        os.makedirs(path, exist_ok=True)
+        for name in NODE_ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), self.arrays[name])
+        pd.Series(self.feature_names or [], dtype=object).to_csv(os.path.join(path, "feature_names.csv"),
+                                                                 index=False, header=False)
+        with open(os.path.join(path, "max_depth.txt"), "w") as f:
+            f.write(str(self.max_depth))
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """
+        Load a compact forest saved with `save`.
+
+        :param path: Directory of the compact forest.
+        :param mmap_mode: Memory-map mode of the node arrays, None to read them in memory.
+        :return: CompactForest.
+        """
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in NODE_ARRAYS}
+        names_path = os.path.join(path, "feature_names.csv")
+        feature_names = None
+        if os.path.getsize(names_path):
+            feature_names = pd.read_csv(names_path, header=None, dtype=str)[0].tolist()
+        with open(os.path.join(path, "max_depth.txt"), "r") as f:
+            max_depth = int(f.read())
+        return cls(arrays, feature_names, max_depth)
+
+
+def validate_export(model, compact, X, atol=1e-4):
+    """
+    Check that the compact forest predicts the same values as the original model.
+
+    :param model: Original fitted forest.
+    :param compact: CompactForest exported from `model`.
+    :param X: Features to compare the predictions on.
+    :param atol: Maximum absolute difference allowed (leaf values are stored as float32).
+    :return: Maximum absolute difference between the predictions.
+    """
+    max_diff = float(np.max(np.abs(model.predict(X) - compact.predict(X)), initial=0.0))
+    if max_diff > atol:
+        raise ValueError(f"Compact forest predictions differ from the original model by up to {max_diff}")
+    return max_diff
+
+
+def export_model(name, version=None, X_check=None, registry_dir=REGISTRY_DIR):
+    """
+    Export a model of the registry to a compact forest, saved next to the model in its version directory, where
+    `load_predictor` finds it.
+
+    :param name: Name of the model.
+    :param version: Version of the model. Default is the latest version.
+    :param X_check: Features to validate the export on, see `validate_export`. None skips the validation.
+    :param registry_dir: Directory of the registry.
+    :return: Path of the compact forest.
+    """
+    version = version or get_latest_version(name, registry_dir)
+    model = load_model(name, version, registry_dir)
+    compact = CompactForest.from_sklearn(model)
+    if X_check is not None:
+        print(f"Compact forest matches the original model within {validate_export(model, compact, X_check):.2e}")
+    path = os.path.join(registry_dir, name, version, COMPACT_DIR)
+    compact.save(path)
+    return path
+
+
+def load_predictor(name, version=None, registry_dir=REGISTRY_DIR):
+    """
+    Load the model used for inference, once per process: the compact forest if the version was exported, otherwise
+    the original model. Like `model_registry.load_model`, the latest version is used without an explicit version, and
+    one version of each model is kept in memory.
+
+    :param name: Name of the model.
+    :param version: Version of the model. Default is the latest version.
+    :param registry_dir: Directory of the registry.
+    :return: An object with a `predict` method.
+    """
+    version = version or get_latest_version(name, registry_dir)
+    path = os.path.join(registry_dir, name, version, COMPACT_DIR)
+    exported = os.path.exists(os.path.join(path, "max_depth.txt"))
+
+    def load():
+        return CompactForest.load(path) if exported else load_model(name, version, registry_dir)
+
+    # a version exported after it was first loaded switches to the compact forest
+    return _loaded_predictors.get((registry_dir, name), (version, exported), load)
+
+
+if __name__ == '__main__':
+    from group_b.demand.feature_store import get_clusters, load_features, model_matrix
+
+    parser = argparse.ArgumentParser(description="Export a random forest of the model registry to a compact forest.")
+    parser.add_argument("--name", default="random_forest")
+    parser.add_argument("--version", default=None, help="Version to export, default is the latest")
+    args = parser.parse_args()
+
+    # validate on the stored features
+    features = load_features()
+    X_check = model_matrix(features, get_clusters(features))
+    print(f"Saved compact forest to {export_model(args.name, args.version, X_check=X_check)}")
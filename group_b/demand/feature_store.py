@@ -0,0 +1,122 @@
+import numpy as np
+import pandas as pd
+
+from group_b.data_io import read_table, write_table
+
+FEATURE_STORE_PATH = "../data/feature_store"
+NUM_LAGS = 4
+LAG_COLUMNS = [f"num_sales_lag_{lag}Q" for lag in range(1, NUM_LAGS + 1)]
+# model features before the one-hot cluster columns, in the order the random forest was trained on
+FEATURE_COLUMNS = ["sentiment_score", "rating", "time_index"] + LAG_COLUMNS
+STORE_COLUMNS = ["cluster_label", "year", "quarter", "num_sales"] + FEATURE_COLUMNS
+
+
+def compute_features(df):
+    """
+    Compute the demand forecasting features in a single pass over a cluster-sorted Numpy array.
+
+    Features:
+    - time_index: continuous time index, year + (quarter - 1) / 4
+    - num_sales_lag_1Q to num_sales_lag_4Q: sales of the previous 1 to 4 quarters of the same cluster
+    - num_sales and its lags are log-transformed with log1p, missing lags (first quarters of a cluster) are 0
+    - cluster identity is kept as a single integer column, see `model_matrix` for the one-hot encoding
+
+    :param df: Dataset with cluster_label, year, quarter, num_sales, sentiment_score and rating columns,
+               one row per cluster and quarter (e.g. combined_dataset).
+    :return: DataFrame with STORE_COLUMNS, sorted by cluster_label, year and quarter.
+    """
+    cluster = df["cluster_label"].to_numpy().astype(np.int32)
+    year = df["year"].to_numpy().astype(np.int32)
+    quarter = df["quarter"].to_numpy().astype(np.int32)
+    order = np.lexsort((quarter, year, cluster))
+    cluster, year, quarter = cluster[order], year[order], quarter[order]
+    num_sales = np.log1p(df["num_sales"].to_numpy(dtype=np.float64)[order])
+
+    features = {
+        "cluster_label": cluster,
+        "year": year,
+        "quarter": quarter,
+        "num_sales": num_sales,
+        "sentiment_score": df["sentiment_score"].to_numpy(dtype=np.float64)[order],
+        "rating": df["rating"].to_numpy(dtype=np.float64)[order],
+        "time_index": year + (quarter - 1) / 4.0,
+    }
+    # a lag is the value k rows earlier, as long as that row belongs to the same cluster
+    for lag, column in enumerate(LAG_COLUMNS, start=1):
+        values = np.zeros(len(num_sales))
+        same_cluster = cluster[lag:] == cluster[:-lag]
+        values[lag:] = np.where(same_cluster, num_sales[:-lag], 0.0)
+        features[column] = values
+
+    features = pd.DataFrame(features, columns=STORE_COLUMNS)
+    features[["sentiment_score", "rating"]] = features[["sentiment_score", "rating"]].fillna(0)
+    return features
+
+
+def save_features(features, path=FEATURE_STORE_PATH):
+    """
+    Save the features so that training, forecasting and pricing read the same values.
+
+    :param features: Output of `compute_features`.
+    :param path: Path to the feature store, without extension.
+    :return: Path of the written file.
+    """
+    return write_table(features, path)
+
+
+def load_features(path=FEATURE_STORE_PATH, columns=None, filters=None):
+    """
+    Load features from the feature store. Filters on cluster_label, year or time_index are pushed down to the reader.
+
+    :param path: Path to the feature store, with or without extension.
+    :param columns: List of columns to read. Default is all columns.
+    :param filters: List of (column, op, value) tuples, see `data_io.read_table`.
+    :return: DataFrame of features.
+    """
+    return read_table(path, columns=columns, filters=filters)
+
+
+def get_clusters(features):
+    """
+    List the cluster labels of the feature store, which define the one-hot columns of the model.
+
+    :param features: DataFrame with a cluster_label column.
+    :return: Sorted Numpy array of cluster labels.
+    """
+    return np.unique(features["cluster_label"].to_numpy())
+
+
+def model_matrix(features, clusters, keep=()):
+    """
+    Build the model input from stored features: FEATURE_COLUMNS followed by one boolean cluster_<label> column per
+    cluster, which is the layout the random forest is trained and predicts on.
+
+    :param features: DataFrame of features with a cluster_label column.
+    :param clusters: All cluster labels (see `get_clusters`), so the one-hot columns do not depend on which
+                     clusters are present in `features`.
+    :param keep: Extra columns of `features` to put before the model features (e.g. num_sales, year, quarter).
+    :return: DataFrame with `keep`, FEATURE_COLUMNS and the one-hot cluster columns.
+    """
+    clusters = np.asarray(clusters)
+    codes = np.searchsorted(clusters, features["cluster_label"].to_numpy())
+    one_hot = np.zeros((len(features), len(clusters)), dtype=bool)
+    one_hot[np.arange(len(features)), codes] = True
+    df_one_hot = pd.DataFrame(one_hot, columns=[f"cluster_{cluster}" for cluster in clusters], index=features.index)
+    return pd.concat([features[list(keep) + FEATURE_COLUMNS], df_one_hot], axis=1)
+
+
+def next_quarter_features(features):
+    """
+    Turn the latest known quarter of each cluster into the model input for the following quarter: each lag moves back
+    by one quarter, the latest sales become the 1-quarter lag, and sentiment and rating are carried over.
+
+    :param features: Stored features of one quarter per cluster (log-transformed num_sales and lags).
+    :return: DataFrame of features for the next quarter, with num_sales removed.
+    """
+    next_features = features.copy()
+    next_features[LAG_COLUMNS[1:]] = features[LAG_COLUMNS[:-1]].to_numpy()
+    next_features[LAG_COLUMNS[0]] = features["num_sales"].to_numpy()
+    next_features["time_index"] = features["time_index"] + 0.25
+    next_features["year"] = np.floor(next_features["time_index"]).astype(int)
+    next_features["quarter"] = np.round((next_features["time_index"] - next_features["year"]) * 4).astype(int) + 1
+    return next_features.drop(columns=["num_sales"])
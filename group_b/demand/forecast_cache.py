@@ -0,0 +1,172 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from group_b.data_io import read_table, write_table
+from group_b.demand.compact_forest import load_predictor
+from group_b.demand.model_registry import REGISTRY_DIR, get_latest_version
+
+FORECAST_CACHE_DIR = "../data/cache/forecasts"
+
+
+def hash_rows(X):
+    """
+    Content hash of every row of a model input, used as the key of a forecast in the cache.
+    Values are hashed as float64, so the same features hash the same whether the cluster columns are bool or float,
+    and the column names are part of the hash, so inputs with a different layout never share a key.
+
+    :param X: DataFrame of model inputs.
+    :return: Numpy array of uint64 hashes, one per row.
+    """
+    columns_hash = hashlib.blake2b("\x1f".join(map(str, X.columns)).encode("utf-8"), digest_size=8).digest()
+    values = pd.DataFrame(X.to_numpy(dtype=np.float64))
+    return pd.util.hash_pandas_object(values, index=False).to_numpy() ^ np.frombuffer(columns_hash, dtype=np.uint64)
+
+
+class ForecastCache:
+    """
+    LRU cache of model predictions keyed by (model version, feature-row hash), with an optional on-disk backing store.
+    Only rows that are not cached are passed to the model, so repeated pricing and restock queries within a planning
+    cycle never run the forest twice for the same input.
+
+    Entries are invalidated without any bookkeeping: publishing a new model version changes the version part of the
+    key, and a change in the underlying dataset changes the features and therefore the row hash. Entries of older
+    model versions are dropped from memory as soon as a newer version is used.
+
+    The backing store keeps one table of (row_hash, prediction) per model version under `cache_dir`, read the first
+    time a version is used and written by `flush`.
+
+    :param name: Name of the model in the registry.
+    :param maxsize: Maximum number of predictions kept in memory.
+    :param cache_dir: Directory of the on-disk backing store. None keeps the cache in memory only.
+    :param registry_dir: Directory of the model registry.
+    """
+
+    def __init__(self, name="random_forest", maxsize=100000, cache_dir=None, registry_dir=REGISTRY_DIR):
+        self.name = name
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.registry_dir = registry_dir
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _store_path(self, version):
+        return os.path.join(self.cache_dir, self.name, version)
+
+    def _use_version(self, version):
+        """
+        Switch to a model version: drop the entries of other versions and read the backing store of this version.
+        """
+        if version == self.version:
+            return
+        self.entries.clear()
+        self.version = version
+        if self.cache_dir is not None:
+            try:
+                stored = read_table(self._store_path(version))
+            except FileNotFoundError:
+                return
+            for row_hash, prediction in zip(stored["row_hash"].to_numpy(np.uint64)[-self.maxsize:],
+                                            stored["prediction"].to_numpy()[-self.maxsize:]):
+                self.entries[int(row_hash)] = prediction
+
+    def predict(self, X, version=None):
+        """
+        Predict with the model, running it only on rows that are not in the cache.
+
+        :param X: DataFrame of model inputs.
+        :param version: Model version. Default is the latest published version.
+        :return: Numpy array of predictions, in the order of the rows of X.
+        """
+        version = version or get_latest_version(self.name, self.registry_dir)
+        self._use_version(version)
+        keys = hash_rows(X).tolist()
+
+        predictions = np.empty(len(keys), dtype=np.float64)
+        missing = []
+        for i, key in enumerate(keys):
+            prediction = self.entries.get(key)
+            if prediction is None:
+                missing.append(i)
+            else:
+                self.entries.move_to_end(key)
+                predictions[i] = prediction
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            model = load_predictor(self.name, version, self.registry_dir)
+            predictions[missing] = model.predict(X.iloc[missing])
+            for i in missing:
+                self.entries[keys[i]] = predictions[i]
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return predictions
+
+    def flush(self):
+        """
+        Write the cached predictions of the current model version to the backing store, merged with what is already
+        stored.
+
+        :return: Path of the written file, or None if there is no backing store or nothing to write.
+        """
+        if self.cache_dir is None or self.version is None or not self.entries:
+            return None
+        df_cache = pd.DataFrame({"row_hash": np.fromiter(self.entries.keys(), dtype=np.uint64, count=len(self)),
+                                 "prediction": np.fromiter(self.entries.values(), dtype=np.float64, count=len(self))})
+        try:
+            stored = read_table(self._store_path(self.version))
+            df_cache = pd.concat([stored, df_cache], ignore_index=True)
+        except FileNotFoundError:
+            pass
+        df_cache = df_cache.drop_duplicates(subset=["row_hash"], keep="last").tail(self.maxsize)
+        return write_table(df_cache, self._store_path(self.version))
+
+    def clear(self):
+        """
+        Drop all predictions kept in memory. The backing store is left untouched.
+        """
+        self.entries.clear()
+        self.version = None
+
+
+class CachedModel:
+    """
+    Wrapper with the `predict` interface of a scikit-learn model, which predicts through a `ForecastCache`, so that it
+    can be passed to code that expects a model (e.g. `next_year_prediction.forecast_multiple_quarters`).
+
+    :param cache: The forecast cache.
+    :param version: Model version. Default is the latest published version at each call.
+    """
+
+    def __init__(self, cache, version=None):
+        self.cache = cache
+        self.version = version
+
+    def predict(self, X):
+        return self.cache.predict(X, version=self.version)
+
+
+# forecast caches shared by the forecasting and pricing code of a process: {(name, cache_dir): ForecastCache}
+_forecast_caches = {}
+
+
+def get_forecast_cache(name="random_forest", cache_dir=FORECAST_CACHE_DIR):
+    """
+    Get the forecast cache of a model, created once per process.
+
+    :param name: Name of the model in the registry.
+    :param cache_dir: Directory of the on-disk backing store, shared between processes. None for memory only.
+    :return: ForecastCache.
+    """
+    if (name, cache_dir) not in _forecast_caches:
+        _forecast_caches[(name, cache_dir)] = ForecastCache(name, cache_dir=cache_dir)
+    return _forecast_caches[(name, cache_dir)]
@@ -0,0 +1,100 @@
+import json
+import os
+
+import joblib
+import pandas as pd
+
+from group_b.data_io import ProcessCache, file_version
+
+REGISTRY_DIR = "../demand/models"
+
+# models loaded in this process, by (registry_dir, name) and versioned by model version
+_loaded_models = ProcessCache()
+# latest published version per model, by (registry_dir, name) and versioned by the mtime of LATEST
+_latest_versions = ProcessCache()
+
+
+def _model_dir(name, registry_dir):
+    return os.path.join(registry_dir, name)
+
+
+def publish_model(model, name, metadata=None, registry_dir=REGISTRY_DIR, version=None):
+    """
+    Save a model as a new version in the registry and make it the latest version.
+    The LATEST pointer is replaced atomically after the model and its metadata are written, so readers never see a
+    partially written version.
+
+    :param model: Trained model.
+    :param name: Name of the model, e.g. "random_forest".
+    :param metadata: Dictionary of metadata to save with the model, e.g. feature columns, training window and WAPE.
+    :param registry_dir: Directory of the registry.
+    :param version: Version tag. Default is the current UTC timestamp.
+    :return: The published version.
+    """
+    version = version or pd.Timestamp.now(tz="UTC").strftime("%Y%m%dT%H%M%S%fZ")
+    version_dir = os.path.join(_model_dir(name, registry_dir), version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    joblib.dump(model, os.path.join(version_dir, "model.joblib"))
+    metadata = dict(metadata or {}, name=name, version=version,
+                    published_at=pd.Timestamp.now(tz="UTC").isoformat())
+    with open(os.path.join(version_dir, "metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2, default=str)
+
+    latest_path = os.path.join(_model_dir(name, registry_dir), "LATEST")
+    with open(f"{latest_path}.tmp", "w") as f:
+        f.write(version)
+    os.replace(f"{latest_path}.tmp", latest_path)
+    return version
+
+
+def get_latest_version(name, registry_dir=REGISTRY_DIR):
+    """
+    Get the latest published version of a model. The LATEST pointer is only re-read when it changes on disk.
+
+    :param name: Name of the model.
+    :param registry_dir: Directory of the registry.
+    :return: The latest version.
+    """
+    latest_path = os.path.join(_model_dir(name, registry_dir), "LATEST")
+    if not os.path.exists(latest_path):
+        raise FileNotFoundError(f"No published version of {name} in {registry_dir}, run random_forest_train.py first")
+
+    def read_latest():
+        with open(latest_path, "r") as f:
+            return f.read().strip()
+
+    return _latest_versions.get((registry_dir, name), file_version(latest_path), read_latest)
+
+
+def get_model_metadata(name, version=None, registry_dir=REGISTRY_DIR):
+    """
+    Read the metadata saved with a model version.
+
+    :param name: Name of the model.
+    :param version: Version of the model. Default is the latest version.
+    :param registry_dir: Directory of the registry.
+    :return: Dictionary of metadata.
+    """
+    version = version or get_latest_version(name, registry_dir)
+    with open(os.path.join(_model_dir(name, registry_dir), version, "metadata.json"), "r") as f:
+        return json.load(f)
+
+
+def load_model(name, version=None, registry_dir=REGISTRY_DIR):
+    """
+    Load a model from the registry, once per process.
+    Without an explicit version, the latest version is returned, so a newly published version is picked up (hot-swapped)
+    by the next call without restarting the process. One version of each model is kept in memory: loading another
+    version replaces the previous one. scikit-learn trees copy their node arrays into their own buffers when
+    unpickled, so every process holds a private copy of the forest: worker processes should predict through
+    `compact_forest.load_predictor`, whose memory-mapped node arrays are shared between processes.
+
+    :param name: Name of the model.
+    :param version: Version of the model. Default is the latest version.
+    :param registry_dir: Directory of the registry.
+    :return: The loaded model.
+    """
+    version = version or get_latest_version(name, registry_dir)
+    return _loaded_models.get((registry_dir, name), version, lambda: joblib.load(
+        os.path.join(_model_dir(name, registry_dir), version, "model.joblib")))
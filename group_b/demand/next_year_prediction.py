@@ -1,53 +1,76 @@
 import numpy as np
 import pandas as pd
-import joblib
+from group_b.data_io import read_table, write_table
+from group_b.demand.feature_store import LAG_COLUMNS, compute_features, get_clusters, load_features, model_matrix
+from group_b.demand.forecast_cache import CachedModel, get_forecast_cache
 
 
 def preprocess(df):
     """
     Preprocesses the input DataFrame for time-series demand forecasting.
 
-    This function prepares the raw_data by:
+    The features are computed by the feature store shared with training and pricing:
     - Sorting data chronologically by cluster, year, and quarter
     - Creating a continuous time index
     - Generating lag features for 'num_sales' (1Q to 4Q)
-    - Applying one-hot encoding to 'cluster_label'
-    - Reordering columns so that one-hot encoded columns are at the end
-    - Applying log transformation to 'num_sales'
+    - Applying log transformation to 'num_sales' and its lags, as in training
     - Filling any missing values (especially in lag columns) with 0
+    - Applying one-hot encoding to 'cluster_label', with the one-hot encoded columns at the end
 
     Parameters:
-        df (pd.DataFrame): Raw input data containing columns 
-                           ['cluster_label', 'year', 'quarter', 'num_sales']
+        df (pd.DataFrame): Raw input data containing columns
+                           ['cluster_label', 'year', 'quarter', 'num_sales', 'sentiment_score', 'rating']
 
     Returns:
         pd.DataFrame: Preprocessed DataFrame ready for training or prediction.
     """
-    df = df.sort_values(by=["cluster_label", "year", "quarter"])
-    df["time_index"] = df["year"] + (df["quarter"] - 1) / 4.0
+    features = compute_features(df)
+    return model_matrix(features, get_clusters(features), keep=["year", "quarter", "num_sales"])
 
-    # Add lag features (1Q to 4Q)
-    df["num_sales_lag_1Q"] = df.groupby("cluster_label")["num_sales"].shift(1)
-    df["num_sales_lag_2Q"] = df.groupby("cluster_label")["num_sales"].shift(2)
-    df["num_sales_lag_3Q"] = df.groupby("cluster_label")["num_sales"].shift(3)
-    df["num_sales_lag_4Q"] = df.groupby("cluster_label")["num_sales"].shift(4)
 
-    # One-hot encode cluster_label
-    df["cluster_label"] = df["cluster_label"].astype(int)
-    df = pd.get_dummies(df, columns=["cluster_label"], prefix="cluster")
+def get_cluster_columns(df, dummy_prefix="cluster_"):
+    """
+    List the one-hot encoded cluster columns, excluding the integer `cluster_label` column.
 
-    # Sort dummy columns to end
-    ohe_cols = sorted([col for col in df.columns if col.startswith("cluster_")],
-                      key=lambda x: int(x.split("_")[-1]))
-    df = df[[col for col in df.columns if col not in ohe_cols] + ohe_cols]
+    Parameters:
+        df (pd.DataFrame): DataFrame with one-hot encoded cluster columns.
+        dummy_prefix (str): Prefix used in one-hot encoded columns.
 
-    # Log-transform sales
-    df["num_sales"] = np.log1p(df["num_sales"])
+    Returns:
+        list: One-hot encoded cluster columns, in column order.
+    """
+    return [col for col in df.columns if col.startswith(dummy_prefix) and col != "cluster_label"]
 
-    # Fill missing lag values
-    df.fillna(0, inplace=True)
 
-    return df
+def get_cluster_codes(df, cluster_cols):
+    """
+    Decode one-hot encoded cluster columns into integer cluster codes with a single argmax over the dummy block.
+
+    Parameters:
+        df (pd.DataFrame): DataFrame with one-hot encoded cluster columns.
+        cluster_cols (list): One-hot encoded cluster columns.
+
+    Returns:
+        np.ndarray: Position of the cluster of each row in `cluster_cols`.
+    """
+    return df[cluster_cols].to_numpy().argmax(axis=1)
+
+
+def _last_row_per_cluster(df, cluster_cols):
+    """
+    Find the position of the latest row (by time_index) of each cluster, with clusters in ascending order.
+
+    Parameters:
+        df (pd.DataFrame): Preprocessed data with one-hot encoded cluster columns.
+        cluster_cols (list): One-hot encoded cluster columns.
+
+    Returns:
+        np.ndarray: Row positions in `df`, one per cluster.
+    """
+    codes = get_cluster_codes(df, cluster_cols)
+    order = np.lexsort((df["time_index"].to_numpy(), codes))
+    is_last = np.r_[codes[order][1:] != codes[order][:-1], True]
+    return order[is_last]
 
 
 def create_future_data_single_step(df, future_year, future_quarter):
@@ -62,36 +85,28 @@ def create_future_data_single_step(df, future_year, future_quarter):
     Returns:
         pd.DataFrame: Future input data ready for model prediction.
     """
-    cluster_cols = [col for col in df.columns if col.startswith("cluster_")]
-    unique_clusters = df[cluster_cols].drop_duplicates()
-
-    future_rows = []
-    for _, cluster_row in unique_clusters.iterrows():
-        mask = (df[cluster_cols] == cluster_row.values).all(axis=1)
-        cluster_df = df[mask].sort_values(by="time_index")
-
-        last_row = cluster_df.iloc[-1].copy()
-        new_row = last_row.copy()
-        new_row["time_index"] = future_year + (future_quarter - 1) / 4.0
-
-        new_row["num_sales_lag_1Q"] = last_row["num_sales"]
-        new_row["num_sales_lag_2Q"] = last_row["num_sales_lag_1Q"]
-        new_row["num_sales_lag_3Q"] = last_row["num_sales_lag_2Q"]
-        new_row["num_sales_lag_4Q"] = last_row["num_sales_lag_3Q"]
-
-        new_row["num_sales"] = 0
-        new_row["year"] = future_year
-        new_row["quarter"] = future_quarter
-
-        future_rows.append(new_row)
-
-    future_df = pd.DataFrame(future_rows)
+    cluster_cols = get_cluster_columns(df)
+    last_rows = df.iloc[_last_row_per_cluster(df, cluster_cols)].reset_index(drop=True)
+
+    future_df = last_rows.copy()
+    future_df["time_index"] = future_year + (future_quarter - 1) / 4.0
+    future_df[LAG_COLUMNS[0]] = last_rows["num_sales"]
+    future_df[LAG_COLUMNS[1:]] = last_rows[LAG_COLUMNS[:-1]].to_numpy()
+    future_df["num_sales"] = 0
+    future_df["year"] = future_year
+    future_df["quarter"] = future_quarter
+
+    # carry the integer cluster label, decoded once from the dummy columns
+    labels = np.array([int(col[len("cluster_"):]) for col in cluster_cols])
+    future_df["cluster_label"] = labels[get_cluster_codes(future_df, cluster_cols)]
     return future_df
 
 
 def forecast_multiple_quarters(rf_model, df, start_year, start_quarter, steps):
     """
-        Iteratively generate forecasts for the next `steps` quarters.
+        Recursively generate forecasts for the next `steps` quarters, for all clusters at once.
+        The last four quarters of sales of every cluster are kept in a Numpy array, and each step advances all
+        clusters with a single `predict` call, using the previous step's prediction as the newest lag.
 
         Parameters:
             rf_model (RandomForestRegressor): Trained model.
@@ -101,35 +116,33 @@ def forecast_multiple_quarters(rf_model, df, start_year, start_quarter, steps):
             steps (int): Number of quarters to forecast.
 
         Returns:
-            pd.DataFrame: Forecasted data including predicted demand per cluster and quarter.
+            pd.DataFrame: Forecasted data including the integer `cluster_label` and predicted demand per cluster
+                          and quarter.
     """
-    df_forecast = df.copy()
-    current_year = start_year
-    current_quarter = start_quarter
-    future_predictions = []
-
     # Determine feature columns: drop target and time-only fields
-    all_cols = df.columns.tolist()
-    feature_cols = [col for col in all_cols if col not in ["num_sales", "year", "quarter"]]
-
-    for _ in range(steps):
-        future_data = create_future_data_single_step(df_forecast, current_year, current_quarter)
-
-        # Ensure all features present
-        for col in feature_cols:
-            if col not in future_data.columns:
-                future_data[col] = 0
-
-        X_future = future_data[feature_cols].copy()
-
-        y_pred_log = rf_model.predict(X_future)
-        y_pred_actual = np.expm1(y_pred_log)
-
-        future_data["predicted_demand"] = y_pred_actual
-        future_data["num_sales"] = np.log1p(y_pred_actual)
-
-        df_forecast = pd.concat([df_forecast, future_data.drop(columns=["year", "quarter"])], ignore_index=True)
-        future_predictions.append(future_data)
+    feature_cols = [col for col in df.columns if col not in ["num_sales", "year", "quarter", "cluster_label"]]
+    lag_idx = [feature_cols.index(col) for col in LAG_COLUMNS]
+    time_idx = feature_cols.index("time_index")
+
+    future_data = create_future_data_single_step(df, start_year, start_quarter)
+    X_future = future_data[feature_cols].to_numpy(dtype=np.float64)
+    lags = X_future[:, lag_idx]
+    n_clusters = len(future_data)
+
+    years, quarters, lag_history, predictions = [], [], [], []
+    current_year, current_quarter = start_year, start_quarter
+    for step in range(steps):
+        if step > 0:
+            # the previous prediction becomes the newest lag
+            lags = np.column_stack([np.log1p(predictions[-1]), lags[:, :-1]])
+        X_future[:, lag_idx] = lags
+        X_future[:, time_idx] = current_year + (current_quarter - 1) / 4.0
+
+        y_pred_log = rf_model.predict(pd.DataFrame(X_future, columns=feature_cols))
+        predictions.append(np.expm1(y_pred_log))
+        years.append(np.full(n_clusters, current_year))
+        quarters.append(np.full(n_clusters, current_quarter))
+        lag_history.append(lags)
 
         if current_quarter == 4:
             current_quarter = 1
@@ -137,7 +150,15 @@ def forecast_multiple_quarters(rf_model, df, start_year, start_quarter, steps):
         else:
             current_quarter += 1
 
-    return pd.concat(future_predictions, ignore_index=True)
+    # emit all horizons together
+    forecast = pd.concat([future_data] * steps, ignore_index=True)
+    forecast["year"] = np.concatenate(years)
+    forecast["quarter"] = np.concatenate(quarters)
+    forecast["time_index"] = forecast["year"] + (forecast["quarter"] - 1) / 4.0
+    forecast[LAG_COLUMNS] = np.vstack(lag_history)
+    forecast["predicted_demand"] = np.concatenate(predictions)
+    forecast["num_sales"] = np.log1p(forecast["predicted_demand"])
+    return forecast
 
 
 def revert_cluster_dummies(df, dummy_prefix="cluster_", baseline_category="0"):
@@ -152,34 +173,32 @@ def revert_cluster_dummies(df, dummy_prefix="cluster_", baseline_category="0"):
         Returns:
             pd.DataFrame: DataFrame with a single `cluster_label` column.
     """
-    dummy_cols = [col for col in df.columns if col.startswith(dummy_prefix)]
-
-    def get_cluster_label(row):
-        if row[dummy_cols].sum() == 0:
-            return baseline_category
-        else:
-            return row[dummy_cols].idxmax().replace(dummy_prefix, "")
+    dummy_cols = get_cluster_columns(df, dummy_prefix)
+    dummies = df[dummy_cols].to_numpy()
+    labels = np.array([col.replace(dummy_prefix, "") for col in dummy_cols], dtype=object)
 
-    df["cluster_label"] = df.apply(get_cluster_label, axis=1)
+    df["cluster_label"] = np.where(dummies.any(axis=1), labels[dummies.argmax(axis=1)], baseline_category)
     return df
 
 
 if __name__ == '__main__':
-    # Load and preprocess original raw_data
-    df = pd.read_csv("../data/combined_dataset.csv")
-    df_preprocessed = preprocess(df)
+    # Load the features computed at training time, or compute them from the combined dataset
+    try:
+        features = load_features()
+        df_preprocessed = model_matrix(features, get_clusters(features), keep=["year", "quarter", "num_sales"])
+    except FileNotFoundError:
+        df_preprocessed = preprocess(read_table("../data/combined_dataset"))
 
-    # Load trained model
-    rf_model = joblib.load("random_forest_model.joblib")
+    # Predict with the latest trained model through the forecast cache shared with pricing
+    forecast_cache = get_forecast_cache("random_forest")
+    rf_model = CachedModel(forecast_cache)
 
     # Forecast demand for 5 quarters from Q4 2023
     future_preds = forecast_multiple_quarters(
         rf_model, df_preprocessed, start_year=2023, start_quarter=4, steps=5
     )
 
-    # Revert cluster dummies for readable output
-    future_preds = revert_cluster_dummies(future_preds, dummy_prefix="cluster_", baseline_category="0")
-
+    # The forecast carries the integer cluster_label, so the cluster dummies do not need to be reverted
     # Format and save final output
     future_preds["predicted_demand"] = future_preds["predicted_demand"].round().astype(int)
     output = future_preds[["cluster_label", "year", "quarter", "predicted_demand"]]
@@ -187,4 +206,6 @@ if __name__ == '__main__':
 
     print(output)
 
-    output.to_csv("../data/next_year_demand.csv", index=False)
+    # Save as parquet (or the format set by GROUP_B_DATA_FORMAT)
+    write_table(output, "../data/next_year_demand")
+    forecast_cache.flush()
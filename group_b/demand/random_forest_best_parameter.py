@@ -1,12 +1,189 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+
+import numpy as np
+from joblib import Parallel, delayed
 from sklearn.metrics import make_scorer
-from sklearn.model_selection import GridSearchCV
-import pandas as pd
+from sklearn.model_selection import GridSearchCV, ParameterSampler
 from sklearn.ensemble import RandomForestRegressor
-from random_forest_train import preprocess, split_train_test, wape
+from group_b.demand.random_forest_train import preprocess, split_train_test, wape
+from group_b.data_io import read_table
+
+CHECKPOINT_PATH = "../data/cache/random_forest_search.jsonl"
+
+# search space of the successive halving search, n_estimators is the budget and is not searched
+PARAM_SPACE = {
+    "max_depth": [10, 20, None],
+    "min_samples_split": [2, 5, 10],
+    "min_samples_leaf": [1, 2, 4],
+    "max_features": [1.0, 0.5, "sqrt"]
+}
+
+
+def time_series_splits(time_index, n_splits=5):
+    """
+    Split rows into expanding-window folds ordered by time: each fold validates on the quarters that directly follow
+    its training quarters, so no fold is trained on the future of its validation rows.
+
+    :param time_index: Time index of each row (year + (quarter - 1) / 4).
+    :param n_splits: Number of folds.
+    :return: List of (train indices, validation indices) tuples.
+    """
+    time_index = np.asarray(time_index)
+    quarters = np.unique(time_index)
+    fold_size = len(quarters) // (n_splits + 1)
+    if fold_size == 0:
+        raise ValueError(f"Not enough quarters ({len(quarters)}) for {n_splits} time series splits")
+
+    splits = []
+    for fold in range(n_splits):
+        start = quarters[len(quarters) - (n_splits - fold) * fold_size]
+        end = quarters[len(quarters) - (n_splits - fold - 1) * fold_size - 1]
+        splits.append((np.flatnonzero(time_index < start),
+                       np.flatnonzero((time_index >= start) & (time_index <= end))))
+    return splits
+
+
+def fit_and_score(params, n_estimators, X, y, train_idx, val_idx):
+    """
+    Train a random forest on one fold and compute its WAPE on the validation quarters, on the original sales scale.
+
+    :param params: Hyperparameters of the random forest, without n_estimators.
+    :param n_estimators: Number of trees, the budget of the trial.
+    :param X: Numpy array of features.
+    :param y: Numpy array of log-transformed sales.
+    :param train_idx: Indices of the training rows.
+    :param val_idx: Indices of the validation rows.
+    :return: WAPE of the fold.
+    """
+    rf = RandomForestRegressor(n_estimators=n_estimators, random_state=42, n_jobs=1, **params)
+    rf.fit(X[train_idx], y[train_idx])
+    return wape(np.expm1(y[val_idx]), np.expm1(rf.predict(X[val_idx])))
+
+
+def search_fingerprint(X, y, time_index, splits):
+    """
+    Hash of the data and the time series splits of a search, so that trials checkpointed on other data (e.g. before
+    a new quarter was added to the dataset) or other splits are never reused.
+
+    :param X: Numpy array of features.
+    :param y: Numpy array of log-transformed sales.
+    :param time_index: Time index of each row.
+    :param splits: List of (train indices, validation indices), from `time_series_splits`.
+    :return: Hex digest.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for array in [X, y, time_index] + [indices for split in splits for indices in split]:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype}{array.shape}".encode("utf-8"))
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def trial_key(params, n_estimators, fold, fingerprint):
+    return json.dumps({"params": params, "n_estimators": n_estimators, "fold": fold, "data": fingerprint},
+                      sort_keys=True)
+
+
+def load_checkpoint(path=CHECKPOINT_PATH):
+    """
+    Read the finished trials of a previous (possibly interrupted) search.
+
+    :param path: Path of the jsonl checkpoint.
+    :return: Dictionary of trial key -> WAPE.
+    """
+    finished = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                if line.endswith("\n"):
+                    trial = json.loads(line)
+                    # trials written before the fingerprint was recorded have no "data" and never match
+                    finished[trial_key(trial["params"], trial["n_estimators"], trial["fold"],
+                                       trial.get("data"))] = trial["wape"]
+    return finished
+
+
+def halving_search(X, y, time_index, param_space=PARAM_SPACE, n_candidates=27, min_estimators=50,
+                   max_estimators=500, factor=3, n_splits=5, n_jobs=-1, checkpoint_path=CHECKPOINT_PATH,
+                   random_state=42):
+    """
+    Successive halving search over random forest hyperparameters, with the number of trees as the budget.
+    All candidates are first evaluated with `min_estimators` trees, then only the best 1/`factor` of them are evaluated
+    again with `factor` times more trees, until `max_estimators` is reached or one candidate is left.
+    Candidates are scored with the mean WAPE over time series splits (see `time_series_splits`).
+
+    Every finished (candidate, budget, fold) trial is appended to a checkpoint file, so rerunning an interrupted search
+    with the same arguments skips the trials that already finished. Trials are keyed by a fingerprint of the data and
+    the splits as well (see `search_fingerprint`), so a search on new data or other splits starts from scratch.
+
+    :param X: DataFrame of features, with a time_index column.
+    :param y: Log-transformed sales.
+    :param time_index: Time index of each row, used for the time series splits.
+    :param param_space: Dictionary of hyperparameter name -> list of values.
+    :param n_candidates: Number of parameter combinations sampled in the first round.
+    :param min_estimators: Number of trees in the first round.
+    :param max_estimators: Maximum number of trees.
+    :param factor: Fraction of candidates kept and growth of the number of trees at each round.
+    :param n_splits: Number of time series splits.
+    :param n_jobs: Number of parallel trials, -1 for all CPUs.
+    :param checkpoint_path: Path of the jsonl checkpoint. None disables checkpointing.
+    :param random_state: Seed of the candidate sampling, keep it fixed to resume a search.
+    :return: tuple of the best parameters (including n_estimators) and the list of evaluated (params, n_estimators,
+             mean WAPE) per round.
+    """
+    X, y = np.asarray(X, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    splits = time_series_splits(time_index, n_splits=n_splits)
+    fingerprint = search_fingerprint(X, y, np.asarray(time_index, dtype=np.float64), splits)
+    candidates = list(ParameterSampler(param_space, n_iter=n_candidates, random_state=random_state))
+    finished = load_checkpoint(checkpoint_path) if checkpoint_path else {}
+    if checkpoint_path:
+        os.makedirs(os.path.dirname(checkpoint_path) or ".", exist_ok=True)
+
+    history = []
+    n_rounds = int(math.floor(math.log(max_estimators / min_estimators, factor))) + 1
+    for round_num in range(n_rounds):
+        n_estimators = min(min_estimators * factor ** round_num, max_estimators)
+        todo = [(params, fold) for params in candidates for fold in range(n_splits)
+                if trial_key(params, n_estimators, fold, fingerprint) not in finished]
+        print(f"Round {round_num}: {len(candidates)} candidates with {n_estimators} trees, "
+              f"{len(todo)} of {len(candidates) * n_splits} trials to run")
+
+        results = Parallel(n_jobs=n_jobs, return_as="generator")(
+            delayed(fit_and_score)(params, n_estimators, X, y, *splits[fold]) for params, fold in todo) if todo else []
+        for (params, fold), score in zip(todo, results):
+            finished[trial_key(params, n_estimators, fold, fingerprint)] = score
+            if checkpoint_path:
+                with open(checkpoint_path, "a") as f:
+                    f.write(json.dumps({"params": params, "n_estimators": n_estimators, "fold": fold,
+                                        "data": fingerprint, "wape": score}) + "\n")
+
+        scores = [np.mean([finished[trial_key(params, n_estimators, fold, fingerprint)] for fold in range(n_splits)])
+                  for params in candidates]
+        history.append([(params, n_estimators, score) for params, score in zip(candidates, scores)])
+        # keep the best 1/factor candidates for the next round
+        order = np.argsort(scores, kind="stable")
+        candidates = [candidates[i] for i in order[:max(1, math.ceil(len(candidates) / factor))]]
+
+    best_params, best_estimators, best_wape = min(history[-1], key=lambda trial: trial[2])
+    print(f"Best mean WAPE over time series splits: {best_wape:.2f}%")
+    return dict(best_params, n_estimators=best_estimators), history
+
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Hyperparameter search for the demand forecasting random forest.")
+    parser.add_argument("--search", choices=["halving", "grid"], default="halving",
+                        help="Successive halving over the number of trees with time series splits (resumable), or "
+                             "the original exhaustive grid search with random folds")
+    parser.add_argument("--candidates", type=int, default=27, help="Number of candidates of the halving search")
+    parser.add_argument("--jobs", type=int, default=-1, help="Number of parallel trials")
+    args = parser.parse_args()
+
     # load raw_data
-    df = pd.read_csv("../data/combined_dataset.csv")
+    df = read_table("../data/combined_dataset")
 
     # preprocess data for splitting
     df = preprocess(df=df)
@@ -14,22 +191,27 @@ if __name__ == '__main__':
     # split train-test data
     X_train, X_test, y_train, y_test = split_train_test(df=df, target_col="num_sales", split_year=2021)
 
-    # initialise param_grid for grid search
-    param_grid = {
-        "n_estimators": [100, 300, 500],
-        "max_depth": [10, 20, None],
-        "min_samples_split": [2, 5, 10],
-        "min_samples_leaf": [1, 2, 4]
-    }
+    if args.search == "halving":
+        best_params, _ = halving_search(X_train, y_train, X_train["time_index"], n_candidates=args.candidates,
+                                        n_jobs=args.jobs)
+        print(f"Best Parameters: {best_params}")
+    else:
+        # initialise param_grid for grid search
+        param_grid = {
+            "n_estimators": [100, 300, 500],
+            "max_depth": [10, 20, None],
+            "min_samples_split": [2, 5, 10],
+            "min_samples_leaf": [1, 2, 4]
+        }
 
-    # conduct grid search for hyperparameter tuning of random forest regressor
-    rf = RandomForestRegressor(random_state=42)
+        # conduct grid search for hyperparameter tuning of random forest regressor
+        rf = RandomForestRegressor(random_state=42)
 
-    # Create a scorer object for WAPE
-    wape_scorer = make_scorer(wape, greater_is_better=False)
+        # Create a scorer object for WAPE
+        wape_scorer = make_scorer(wape, greater_is_better=False)
 
-    grid_search = GridSearchCV(estimator=rf, param_grid=param_grid, cv=5, scoring=wape_scorer, n_jobs=-1)
-    grid_search.fit(X_train, y_train)
+        grid_search = GridSearchCV(estimator=rf, param_grid=param_grid, cv=5, scoring=wape_scorer, n_jobs=-1)
+        grid_search.fit(X_train, y_train)
 
-    print(f"Best Parameters: {grid_search.best_params_}")
-    # Best Parameters: {'max_depth': None, 'min_samples_leaf': 1, 'min_samples_split': 2, 'n_estimators': 500}
+        print(f"Best Parameters: {grid_search.best_params_}")
+        # Best Parameters: {'max_depth': None, 'min_samples_leaf': 1, 'min_samples_split': 2, 'n_estimators': 500}
@@ -1,54 +1,43 @@
-import os
+import argparse
+import copy
+import time
 
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import RandomForestRegressor
-import joblib
+
+from group_b.data_io import read_table
+from group_b.demand.feature_store import compute_features, get_clusters, model_matrix, save_features
+from group_b.demand.model_registry import get_model_metadata, load_model, publish_model
+from group_b.demand.compact_forest import export_model
+
+# got the best params from hyperparameter tuning (grid search)
+BEST_PARAMS = {
+    "n_estimators": 500,
+    "max_depth": None,
+    "min_samples_split": 2,
+    "min_samples_leaf": 1,
+    "random_state": 42
+}
 
 
 def preprocess(df):
     """
     Preprocesses the raw_data for sales forecasting.
+    Features are computed once by the feature store (log-transformed sales and lagged sales, time index) and saved
+    so that forecasting and pricing use the same values.
 
     :param df: Dataframe.
     :return: Preprocessed Dataframe.
     """
-    # sort by year and quarter
-    df = df.sort_values(by=["cluster_label", "year", "quarter"])
-
-    # create a continuous time index and lagged sales features
-    df["time_index"] = df["year"] + (df["quarter"] - 1) / 4
-    df["num_sales_lag_1Q"] = df.groupby("cluster_label")["num_sales"].shift(1)
-    df["num_sales_lag_2Q"] = df.groupby("cluster_label")["num_sales"].shift(2)
-    df["num_sales_lag_3Q"] = df.groupby("cluster_label")["num_sales"].shift(3)
-    df["num_sales_lag_4Q"] = df.groupby("cluster_label")["num_sales"].shift(4)
+    features = compute_features(df)
+    save_features(features)
 
     # remove years before 2013 due to lack of data
-    df = df[df["time_index"] >= 2012]
-
-    # one-hot encoding for cluster label
-    df['cluster_label'] = df['cluster_label'].astype(int)
-    df = pd.get_dummies(df, columns=['cluster_label'], prefix='cluster')
-    ohe_cols = sorted([col for col in df.columns if col.startswith('cluster_')],
-                      key=lambda x: int(x.split('_')[-1]))
-    df = df[[col for col in df.columns if col not in ohe_cols] + ohe_cols]
-
-    # apply log transformation to num_sales and lagged num_sales
-    df["num_sales"] = np.log1p(df["num_sales"])
-    df["num_sales_lag_1Q"] = np.log1p(df["num_sales_lag_1Q"])
-    df["num_sales_lag_2Q"] = np.log1p(df["num_sales_lag_2Q"])
-    df["num_sales_lag_3Q"] = np.log1p(df["num_sales_lag_3Q"])
-    df["num_sales_lag_4Q"] = np.log1p(df["num_sales_lag_4Q"])
-
-    # remove year and quarter
-    df = df.drop(columns=['year', 'quarter'])
+    features = features[features["time_index"] >= 2012]
 
-    # fill missing values with 0 sales
-    df.fillna(0, inplace=True)
-
-    os.makedirs("../data", exist_ok=True)
-    df.to_csv("../data/random_forest_dataset.csv", index=False)
-    return df
+    # one-hot encoding for cluster label, year and quarter are not used as features
+    return model_matrix(features, get_clusters(features), keep=["num_sales"])
 
 
 def split_train_test(df, target_col, split_year):
@@ -83,38 +72,161 @@ def wape(y_test, y_pred):
     return wape
 
 
-if __name__ == '__main__':
-    # load final training raw_data
-    df = pd.read_csv("../data/combined_dataset.csv")
+def warm_start_retrain(model, X_recent, y_recent, n_new_trees=50, random_state=None):
+    """
+    Update a trained random forest with recent data instead of refitting it on the full history.
+    `n_new_trees` trees are grown on the recent data with `warm_start=True`, and the same number of the oldest trees
+    are pruned, so the forest keeps its size and gradually shifts towards recent quarters.
+
+    :param model: Trained RandomForestRegressor. It is not modified, a retrained copy is returned.
+    :param X_recent: Features of the recent quarters (e.g. the new quarter and the quarters before it).
+    :param y_recent: Log-transformed sales of the recent quarters.
+    :param n_new_trees: Number of trees to add and to prune.
+    :param random_state: Seed of the new trees. Use a different seed at each retrain, so the new trees do not reuse
+                         the seeds of the existing ones.
+    :return: Retrained RandomForestRegressor.
+    """
+    model = copy.deepcopy(model)
+    n_trees = len(model.estimators_)
+    model.set_params(warm_start=True, n_estimators=n_trees + n_new_trees, random_state=random_state)
+    model.fit(X_recent, y_recent)
 
-    # preprocess data for splitting
-    df = preprocess(df=df)
+    # prune the oldest trees
+    model.estimators_ = model.estimators_[n_new_trees:]
+    model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+    return model
 
-    # split train-test data
-    X_train, X_test, y_train, y_test = split_train_test(df=df, target_col="num_sales", split_year=2021)
 
-    # got the best params from hyperparameter tuning (grid search)
-    best_params = {
-        "n_estimators": 500,
-        "max_depth": None,
-        "min_samples_split": 2,
-        "min_samples_leaf": 1,
-        "random_state": 42
-    }
+def recent_rows(X, last_time_index, num_quarters):
+    """
+    Mask of the rows of the last `num_quarters` quarters up to and including `last_time_index`.
+    """
+    return (X["time_index"] > last_time_index - num_quarters / 4) & (X["time_index"] <= last_time_index)
 
-    # train random forest regressor
-    rf_best = RandomForestRegressor(**best_params)
-    rf_best.fit(X_train, y_train)
 
-    # prediction
-    y_pred_log = rf_best.predict(X_test)
-    y_pred_actual = np.expm1(y_pred_log)
+def benchmark_retrain(X, y, split_year, params=BEST_PARAMS, n_new_trees=50, recent_quarters=8):
+    """
+    Compare a full refit with a warm-start retrain when the last quarter before `split_year` arrives.
+    Both start from a forest trained on the quarters before that last quarter, and both are evaluated on the quarters
+    from `split_year` onwards.
+
+    :param X: Preprocessed features, with a time_index column.
+    :param y: Log-transformed sales.
+    :param split_year: Start of the evaluation quarters.
+    :param params: Parameters of the random forest.
+    :param n_new_trees: Number of trees added (and pruned) by the warm-start retrain.
+    :param recent_quarters: Number of recent quarters the new trees are trained on.
+    :return: DataFrame with the training time and WAPE of each strategy.
+    """
+    new_quarter = split_year - 0.25
+    history = X["time_index"] < new_quarter
+    train = X["time_index"] <= new_quarter
+    test = X["time_index"] >= split_year
+    base_model = RandomForestRegressor(**params, n_jobs=-1).fit(X[history], y[history])
+
+    results = []
+    start = time.perf_counter()
+    full_model = RandomForestRegressor(**params, n_jobs=-1).fit(X[train], y[train])
+    results.append(("full refit", time.perf_counter() - start, full_model))
+
+    start = time.perf_counter()
+    recent = recent_rows(X, new_quarter, recent_quarters)
+    warm_model = warm_start_retrain(base_model, X[recent], y[recent], n_new_trees=n_new_trees,
+                                    random_state=int(new_quarter * 4))
+    results.append((f"warm start (+{n_new_trees} trees)", time.perf_counter() - start, warm_model))
+    results.append(("no retrain", 0.0, base_model))
+
+    return pd.DataFrame([{
+        "strategy": name,
+        "train_seconds": seconds,
+        "wape": wape(np.expm1(y[test]), np.expm1(model.predict(X[test]))),
+    } for name, seconds, model in results])
 
-    y_test_actual = np.expm1(y_test)
 
-    # save the trained model for future use
-    joblib.dump(rf_best, "random_forest_model.joblib")
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Train the demand forecasting random forest.")
+    parser.add_argument("--mode", choices=["full", "warm-start", "benchmark"], default="full",
+                        help="Refit the forest on the full history, update the latest published forest with the "
+                             "quarters it has not seen yet, or compare both")
+    parser.add_argument("--new-trees", type=int, default=50, help="Number of trees added and pruned by a warm start")
+    parser.add_argument("--recent-quarters", type=int, default=8,
+                        help="Number of recent quarters the new trees are trained on")
+    args = parser.parse_args()
+
+    # load final training raw_data
+    df = read_table("../data/combined_dataset")
+
+    # preprocess data for splitting
+    df = preprocess(df=df)
 
-    # evaluate model performance using weighted absolute percentage error (WAPE)
-    wape = wape(y_test_actual, y_pred_actual)
-    print(f"Weighted Absolute Percentage Error (WAPE): {wape:.2f}%")
+    if args.mode == "benchmark":
+        X, y = df.drop(columns=["num_sales"]), df["num_sales"]
+        print(benchmark_retrain(X, y, split_year=2021, n_new_trees=args.new_trees,
+                                recent_quarters=args.recent_quarters))
+
+    elif args.mode == "warm-start":
+        X, y = df.drop(columns=["num_sales"]), df["num_sales"]
+        rf_model = load_model("random_forest")
+        metadata = get_model_metadata("random_forest")
+        window_start, window_end = metadata["training_window"]
+        last_quarter = X["time_index"].max()
+        if last_quarter <= window_end:
+            print(f"No quarters after {window_end}, the latest model is up to date")
+        else:
+            # forecast error of the current model on the quarters it has not seen yet
+            new = X["time_index"] > window_end
+            new_wape = wape(np.expm1(y[new]), np.expm1(rf_model.predict(X[new])))
+            print(f"WAPE on the new quarters before retraining: {new_wape:.2f}%")
+
+            recent = recent_rows(X, last_quarter, args.recent_quarters)
+            rf_updated = warm_start_retrain(rf_model, X[recent], y[recent], n_new_trees=args.new_trees,
+                                            random_state=int(last_quarter * 4))
+
+            # evaluate on the same test quarters as the full refit (the new trees may have seen some of them)
+            split_year = metadata.get("split_year", 2021)
+            test = X["time_index"] >= split_year
+            retrained_wape = wape(np.expm1(y[test]), np.expm1(rf_updated.predict(X[test])))
+            print(f"Weighted Absolute Percentage Error (WAPE) from {split_year}: {retrained_wape:.2f}%")
+
+            version = publish_model(rf_updated, "random_forest", metadata=dict(
+                metadata,
+                training_window=[window_start, float(last_quarter)],
+                retrained_from=metadata["version"],
+                split_year=split_year,
+                wape=float(retrained_wape),
+                new_quarters_wape_before_retrain=float(new_wape),
+                warm_start={"new_trees": args.new_trees, "recent_quarters": args.recent_quarters},
+            ))
+            print(f"Published random_forest version {version}")
+            export_model("random_forest", version, X_check=X[recent])
+
+    else:
+        # split train-test data
+        X_train, X_test, y_train, y_test = split_train_test(df=df, target_col="num_sales", split_year=2021)
+
+        # train random forest regressor
+        rf_best = RandomForestRegressor(**BEST_PARAMS)
+        rf_best.fit(X_train, y_train)
+
+        # prediction
+        y_pred_log = rf_best.predict(X_test)
+        y_pred_actual = np.expm1(y_pred_log)
+
+        y_test_actual = np.expm1(y_test)
+
+        # evaluate model performance using weighted absolute percentage error (WAPE)
+        wape = wape(y_test_actual, y_pred_actual)
+        print(f"Weighted Absolute Percentage Error (WAPE): {wape:.2f}%")
+
+        # publish the trained model to the model registry for forecasting and pricing
+        version = publish_model(rf_best, "random_forest", metadata={
+            "feature_columns": list(X_train.columns),
+            "training_window": [float(X_train["time_index"].min()), float(X_train["time_index"].max())],
+            "split_year": 2021,
+            "params": BEST_PARAMS,
+            "wape": float(wape),
+        })
+        print(f"Published random_forest version {version}")
+
+        # export a compact copy of the forest for forecasting and pricing
+        export_model("random_forest", version, X_check=X_test)
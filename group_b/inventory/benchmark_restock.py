@@ -0,0 +1,127 @@
+import math
+import time
+
+import pandas as pd
+import numpy as np
+from scipy.stats import norm
+from group_b.inventory.inventory_optimization import (get_quarterly_reorder_point, get_quarterly_eoq,
+                                                      get_quarterly_restock, get_restock_flags)
+from group_b.inventory.simulation import ReorderPointPolicy, lead_time_in_periods, simulate, to_period_matrix
+
+
+def generate_synthetic_data(n_clusters=10000, n_periods=52, seed=42):
+    """
+        Generate a synthetic demand and stock dataset with weekly periods, in the format used by the scenario tests.
+
+        Parameters:
+            n_clusters (int): Number of clusters.
+            n_periods (int): Number of weekly periods per cluster.
+            seed (int): Random seed.
+
+        Returns:
+            tuple: Demand dataframe and stock dataframe.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2025-01-06", periods=n_periods, freq="W-MON")
+    base_demand = rng.integers(30, 40, size=n_clusters)
+
+    demand_df = pd.DataFrame({
+        "cluster_label": np.repeat(np.arange(n_clusters), n_periods),
+        "date": np.tile(dates, n_clusters),
+        "predicted_demand": np.maximum(5, np.repeat(base_demand, n_periods)
+                                       + rng.integers(-10, 10, size=n_clusters * n_periods)),
+    })
+    demand_df["year_quarter"] = demand_df["date"].dt.to_period("Q")
+    demand_df["moving_avg_demand"] = demand_df.groupby("cluster_label")["predicted_demand"].transform(
+        lambda x: x.rolling(window=10, min_periods=1).mean())
+
+    stock_df = pd.DataFrame({
+        "cluster_label": np.arange(n_clusters),
+        "stock_quantity": rng.integers(300, 400, size=n_clusters),
+        "lead_time_months": rng.uniform(1, 3, size=n_clusters).round(2),
+        "order_cost": rng.integers(30, 80, size=n_clusters),
+        "holding_cost": rng.uniform(1, 10, size=n_clusters).round(2),
+    })
+    return demand_df, stock_df
+
+
+def restock_flags_rowwise(df):
+    """
+        Restock decision with the previous row-by-row `DataFrame.apply`, kept as the reference of the benchmark.
+    """
+    return df.apply(lambda row: 1 if (row['stock_quantity'] <= row['reorder_point']) and (row['reorder_point'] > 0)
+                    and (row['optimal_qty'] > 0) else 0, axis=1)
+
+
+def simulate_rowwise(demand, initial_stock, lead_time, reorder_point, order_qty):
+    """
+        Reorder point / EOQ simulation with lost sales, cluster by cluster and period by period in plain python, kept
+        as the reference of the benchmark. Returns the unmet demand per cluster and period.
+    """
+    n_clusters, n_periods = demand.shape
+    unmet = np.zeros((n_clusters, n_periods))
+    for i in range(n_clusters):
+        on_hand, arrivals = float(initial_stock[i]), {}
+        for t in range(n_periods):
+            on_hand += arrivals.pop(t, 0.0)
+            position = on_hand + sum(arrivals.values())
+            rop, qty = reorder_point[i, t], order_qty[i, t]
+            if position <= rop and rop > 0 and qty > 0:
+                order = (math.floor((rop - position) / qty) + 1) * qty
+                if lead_time[i] == 0:
+                    on_hand += order
+                else:
+                    arrivals[t + lead_time[i]] = arrivals.get(t + lead_time[i], 0.0) + order
+            served = min(max(on_hand, 0.0), demand[i, t])
+            unmet[i, t] = demand[i, t] - served
+            on_hand -= served
+    return unmet
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    demand_df, stock_df = generate_synthetic_data()
+    z_score = norm.ppf(0.95)
+    print(f"Synthetic dataset: {demand_df['cluster_label'].nunique()} clusters x "
+          f"{demand_df['date'].nunique()} weekly periods ({len(demand_df)} rows)")
+
+    # Restock decision, on the cluster x quarter table of get_quarterly_restock
+    restock_df = pd.merge(get_quarterly_reorder_point(demand_df, stock_df, z_score),
+                          get_quarterly_eoq(demand_df, stock_df), on=['cluster_label', 'year_quarter'])
+    restock_df = pd.merge(restock_df, stock_df[['cluster_label', 'stock_quantity']], on='cluster_label')
+    flags_rowwise, t_flags_rowwise = timed(restock_flags_rowwise, restock_df)
+    flags, t_flags = timed(get_restock_flags, restock_df['stock_quantity'], restock_df['reorder_point'],
+                           restock_df['optimal_qty'])
+    assert np.array_equal(flags_rowwise.to_numpy(), flags)
+
+    # Stock simulation with stockout accounting, on every cluster and weekly period, as in the scenario tests
+    plan_df = demand_df.merge(restock_df[['cluster_label', 'year_quarter', 'reorder_point', 'optimal_qty']],
+                              on=['cluster_label', 'year_quarter'])
+    demand, clusters, periods = to_period_matrix(demand_df, "predicted_demand", period_col="date")
+    reorder_point, _, _ = to_period_matrix(plan_df, "reorder_point", clusters, periods, period_col="date")
+    optimal_qty, _, _ = to_period_matrix(plan_df, "optimal_qty", clusters, periods, period_col="date")
+    stock = stock_df.set_index("cluster_label").reindex(clusters)
+    initial_stock = stock["stock_quantity"].to_numpy(dtype=float)
+    lead_time = lead_time_in_periods(stock["lead_time_months"].to_numpy(), period_months=12 / 52)
+    unmet_rowwise, t_unmet_rowwise = timed(simulate_rowwise, demand, initial_stock, lead_time, reorder_point,
+                                           optimal_qty)
+    result, t_unmet = timed(simulate, demand, initial_stock, lead_time,
+                            ReorderPointPolicy(reorder_point, optimal_qty))
+    assert np.allclose(unmet_rowwise, result.unmet_demand)
+
+    _, t_total = timed(get_quarterly_restock, demand_df, stock_df, z_score)
+
+    results = pd.DataFrame({
+        "step": ["restock decision", "stock simulation"],
+        "rows": [len(restock_df), demand.size],
+        "row-wise (s)": [t_flags_rowwise, t_unmet_rowwise],
+        "vectorized (s)": [t_flags, t_unmet],
+    })
+    results["speedup"] = results["row-wise (s)"] / results["vectorized (s)"]
+    print(results.to_string(index=False))
+    print(f"get_quarterly_restock end to end: {t_total:.2f}s")
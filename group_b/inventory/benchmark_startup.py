@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+# modules of the inventory library, and the third-party imports they need, as a reference for their import time
+MODULES = ["inventory_optimization", "normal_scenario", "simulation", "scenario_runner", "service_level_optimizer"]
+DEPENDENCIES = "import numpy, pandas, scipy.stats, joblib"
+
+
+def time_import(statement, repeats=5):
+    """
+        Measure the import time of a statement in fresh interpreters, so that nothing is already imported or cached.
+
+        Parameters:
+            statement (str): Import statement, e.g. "import normal_scenario".
+            repeats (int): Number of fresh interpreters.
+
+        Returns:
+            float: Median import time in seconds.
+    """
+    code = f"import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)"
+    env = dict(os.environ)
+    repo_root = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [repo_root, env.get("PYTHONPATH")]))
+    times = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env)
+        times.append(float(output.stdout.strip().splitlines()[-1]))
+    return float(np.median(times))
+
+
+if __name__ == '__main__':
+    dependencies = time_import(DEPENDENCIES)
+    results = pd.DataFrame({
+        "module": ["(numpy, pandas, scipy, joblib)"] + MODULES,
+        "import time (s)": [dependencies] + [time_import(f"import {module}") for module in MODULES],
+    })
+    print(results.to_string(index=False))
@@ -1,11 +1,13 @@
 import pandas as pd
 import numpy as np
 from scipy.stats import norm
+from group_b.data_io import read_table
+from group_b.inventory.simulation import lead_time_in_periods
+
+DEMAND_PATH = "../data/next_year_demand"
+RESTOCK_LIST_PATH = "data/quarterly_restock_list.csv"
 
-# Load raw_data (output from B Q1 Demand Forecasting Model)
-demand_df = pd.read_csv("../data/next_year_demand.csv")
 
-# Transform demand_df
 def convert_to_date(year, quarter):
     """
     Convert year and quarter into a real date.
@@ -18,54 +20,77 @@ def convert_to_date(year, quarter):
     return pd.to_datetime(f"{year}-{quarter_to_month[quarter]}-01", format="%Y-%m-%d")
 
 
-demand_df["date"] = demand_df.apply(lambda row: convert_to_date(row["year"], row["quarter"]), axis=1)
-demand_df = demand_df.drop(columns=["year", "quarter"])
+def load_demand(path=DEMAND_PATH):
+    """
+        Load the forecasted demand (output from B Q1 Demand Forecasting Model) and prepare it for the inventory
+        calculations.
+
+        Parameters:
+            path (str): Path to next_year_demand, with or without extension (see `data_io.resolve_path`).
+
+        Returns:
+            pd.DataFrame: Demand per cluster with date, year_quarter and moving average demand.
+    """
+    demand_df = read_table(path)
+
+    # Transform demand_df
+    demand_df["date"] = demand_df.apply(lambda row: convert_to_date(row["year"], row["quarter"]), axis=1)
+    demand_df = demand_df.drop(columns=["year", "quarter"])
+
+    # Calculate Moving Average to smoothen out demand fluctuations
+    demand_df['moving_avg_demand'] = demand_df.groupby(by=['cluster_label'])['predicted_demand'].transform(
+        lambda x: x.rolling(window=10, min_periods=1).mean())
 
-# Calculate Moving Average to smoothen out demand fluctuations
-demand_df['moving_avg_demand'] = demand_df.groupby(by=['cluster_label'])['predicted_demand'].transform(
-    lambda x: x.rolling(window=10, min_periods=1).mean())
+    demand_df['date'] = pd.to_datetime(demand_df['date'], format="%Y-%m-%d")
+    demand_df['year_quarter'] = demand_df['date'].dt.to_period("Q")
+    return demand_df
 
-demand_df['date'] = pd.to_datetime(demand_df['date'], format="%Y-%m-%d")
-demand_df['year_quarter'] = demand_df['date'].dt.to_period("Q")
-std_dev_demand = demand_df["predicted_demand"].std()
 
-# Set desired service level (e.g. 95% confidence)
-service_level = 0.95
-z_score = norm.ppf(service_level)
+def generate_stock_data(demand_df, seed=42):
+    """
+        Generate the stock data of each cluster: half of the forecasted demand in stock, and random lead times,
+        order costs and holding costs.
+
+        Parameters:
+            demand_df (pd.DataFrame): Demand dataframe.
+            seed (int): Random seed, for reproducibility.
 
-# Generate stock_df
-stock_df = demand_df.copy()
-stock_df = stock_df.groupby("cluster_label").agg({
-    "predicted_demand": "sum"
-}).reset_index()
+        Returns:
+            pd.DataFrame: Stock dataframe.
+    """
+    stock_df = demand_df.groupby("cluster_label").agg({
+        "predicted_demand": "sum"
+    }).reset_index()
 
-np.random.seed(42)  # Set seed for reproducibility
-stock_df["stock_quantity"] = stock_df["predicted_demand"] * 0.5
-stock_df["lead_time_months"] = np.random.uniform(0.1, 3, size=len(stock_df)).round(2)
-stock_df["order_cost"] = np.random.randint(20, 80, size=len(stock_df))
-stock_df["holding_cost"] = np.random.randint(2, 10, size=len(stock_df))
-stock_df["last_restocked"] = "01/07/2023"
+    np.random.seed(seed)  # Set seed for reproducibility
+    stock_df["stock_quantity"] = stock_df["predicted_demand"] * 0.5
+    stock_df["lead_time_months"] = np.random.uniform(0.1, 3, size=len(stock_df)).round(2)
+    stock_df["order_cost"] = np.random.randint(20, 80, size=len(stock_df))
+    stock_df["holding_cost"] = np.random.randint(2, 10, size=len(stock_df))
+    stock_df["last_restocked"] = "01/07/2023"
 
-# Select final columns (without category column)
-stock_df = stock_df[[
-    "cluster_label", "stock_quantity",
-    "lead_time_months", "order_cost", "holding_cost", "last_restocked"
-]]
+    # Select final columns (without category column)
+    return stock_df[[
+        "cluster_label", "stock_quantity",
+        "lead_time_months", "order_cost", "holding_cost", "last_restocked"
+    ]]
 
 
-def get_quarterly_safety_stock(df_1, df_2, z_score):
+def get_quarterly_safety_stock(df_1, df_2, z_score, review_period=1):
     """
         Calculate quarterly safety stock for each cluster using standard deviation
-        of moving average demand and lead time. 
+        of moving average demand, over the lead time and the review period.
         
         Terms:
             Safety stock: acts as buffer against uncertainties in demand and supply
             Lead Time: Total time taken to receive the good after placing a purchase order
+            Review period: Number of quarters between two restocking decisions
 
         Parameters:
             df_1 (pd.DataFrame): Demand dataframe
             df_2 (pd.DataFrame): Stock dataframe
             z_score (float): Z-score corresponding to the desired service level.
+            review_period (int): Review period in quarters.
 
         Returns:
             pd.DataFrame: Quarterly safety stock values per cluster and quarter.
@@ -80,21 +105,23 @@ def get_quarterly_safety_stock(df_1, df_2, z_score):
     safety_stock_df['quarterly_pd_std'] = safety_stock_df['quarterly_pd_std'].fillna(1.0)
 
     # Convert lead time to quarters (round up)
-    safety_stock_df['lead_time_quarters'] = (safety_stock_df['lead_time_months'] / 3).apply(np.ceil)
+    safety_stock_df['lead_time_quarters'] = lead_time_in_periods(safety_stock_df['lead_time_months'])
 
-    # Compute Quarterly Safety Stock
+    # Compute Quarterly Safety Stock, over the lead time and the review period an order has to cover
     safety_stock_df['quarterly_safety_stock'] = np.maximum(
-        z_score * safety_stock_df['quarterly_pd_std'] * np.sqrt(np.maximum(safety_stock_df['lead_time_quarters'], 1)),
+        z_score * safety_stock_df['quarterly_pd_std'] * np.sqrt(safety_stock_df['lead_time_quarters'] + review_period),
         5
     )
 
     return safety_stock_df.drop(columns=['lead_time_quarters'])
 
 
-def get_quarterly_reorder_point(df_1, df_2, z_score):
+def get_quarterly_reorder_point(df_1, df_2, z_score, review_period=1):
     """
         Calculate reorder point for each cluster and quarter using:
-        Reorder Point = (Moving Avg Demand × Lead Time) + Safety Stock
+        Reorder Point = (Moving Avg Demand × (Lead Time + Review Period)) + Safety Stock
+        The stock is only reviewed once per review period, so an order has to cover the demand until the order of the
+        next review arrives (the protection interval), not only the lead time.
 
         Terms: 
             Reorder point: critical stock level that signals the need to reorder
@@ -103,6 +130,7 @@ def get_quarterly_reorder_point(df_1, df_2, z_score):
             df_1 (pd.DataFrame): Demand dataframe
             df_2 (pd.DataFrame): Stock dataframe
             z_score (float): Z-score for service level.
+            review_period (int): Review period in quarters.
 
         Returns:
             pd.DataFrame: Reorder point per cluster and quarter.
@@ -113,7 +141,8 @@ def get_quarterly_reorder_point(df_1, df_2, z_score):
     reorder_df['quarterly_avg_pd'] = reorder_df['quarterly_avg_pd'].fillna(0)
 
     # Get safety stock for each cluster and quarter
-    safety_stock_df = get_quarterly_safety_stock(df_1, df_2, z_score).drop(columns=['quarterly_pd_std'])
+    safety_stock_df = get_quarterly_safety_stock(df_1, df_2, z_score, review_period).drop(
+        columns=['quarterly_pd_std'])
     reorder_df = pd.merge(reorder_df, safety_stock_df, on=['cluster_label', 'year_quarter'], how="outer")
     reorder_df['quarterly_safety_stock'] = reorder_df['quarterly_safety_stock'].fillna(0)
 
@@ -121,16 +150,16 @@ def get_quarterly_reorder_point(df_1, df_2, z_score):
     lead_time_df = df_2[['cluster_label', 'lead_time_months']].drop_duplicates()
 
     # Convert lead time from months to quarters (round up)
-    lead_time_df['lead_time_quarters'] = np.ceil(lead_time_df['lead_time_months'] / 3)
+    lead_time_df['lead_time_quarters'] = lead_time_in_periods(lead_time_df['lead_time_months'])
 
     # Merge this info into reorder_df based on cluster_label
     reorder_df = pd.merge(reorder_df, lead_time_df[['cluster_label', 'lead_time_quarters']], on='cluster_label',
                           how='left')
     reorder_df['lead_time_quarters'] = reorder_df['lead_time_quarters'].fillna(1)
 
-    # Calculate reorder point
-    reorder_df['reorder_point'] = (reorder_df['quarterly_avg_pd'] * reorder_df['lead_time_quarters']) + reorder_df[
-        'quarterly_safety_stock']
+    # Calculate reorder point over the protection interval
+    reorder_df['reorder_point'] = (reorder_df['quarterly_avg_pd'] * (reorder_df['lead_time_quarters'] + review_period)
+                                   + reorder_df['quarterly_safety_stock'])
 
     return reorder_df
 
@@ -163,6 +192,24 @@ def get_quarterly_eoq(df_1, df_2):
     return eoq_df
 
 
+def get_restock_flags(stock_quantity, reorder_point, optimal_qty):
+    """
+        Flag the rows that need restocking: the stock is at or below a positive reorder point, and the optimal order
+        quantity is positive.
+
+        Parameters:
+            stock_quantity (array-like): Current stock level per row.
+            reorder_point (array-like): Reorder point per row.
+            optimal_qty (array-like): Optimal order quantity (EOQ) per row.
+
+        Returns:
+            np.ndarray: 1 where restocking is needed, 0 otherwise.
+    """
+    stock_quantity, reorder_point, optimal_qty = (np.asarray(stock_quantity), np.asarray(reorder_point),
+                                                  np.asarray(optimal_qty))
+    return ((stock_quantity <= reorder_point) & (reorder_point > 0) & (optimal_qty > 0)).astype(int)
+
+
 def get_quarterly_restock(df_1, df_2, z_score):
     """
         Determine which clusters need restocking for each quarter. Restock if current stock levels fall below Reorder Point.
@@ -184,9 +231,8 @@ def get_quarterly_restock(df_1, df_2, z_score):
     to_restock_df = pd.merge(to_restock_df, stock_df, on='cluster_label')
 
     # Identify which clusters need restocking
-    to_restock_df['to_restock'] = to_restock_df.apply(
-        lambda row: 1 if (row['stock_quantity'] <= row['reorder_point']) and (row['reorder_point'] > 0) and (
-                row['optimal_qty'] > 0) else 0, axis=1)
+    to_restock_df['to_restock'] = get_restock_flags(to_restock_df['stock_quantity'], to_restock_df['reorder_point'],
+                                                    to_restock_df['optimal_qty'])
 
     # Filter for clusters that need restocking
     to_restock_df = to_restock_df[to_restock_df['to_restock'] == 1].reset_index(drop=True)
@@ -194,6 +240,14 @@ def get_quarterly_restock(df_1, df_2, z_score):
     return to_restock_df[['cluster_label', 'year_quarter', 'to_restock', 'optimal_qty']]
 
 
-# Save final restock list
-result = get_quarterly_restock(demand_df, stock_df, z_score)
-result.to_csv("data/quarterly_restock_list.csv", index=False)
+if __name__ == '__main__':
+    demand_df = load_demand()
+    stock_df = generate_stock_data(demand_df)
+
+    # Set desired service level (e.g. 95% confidence)
+    service_level = 0.95
+    z_score = norm.ppf(service_level)
+
+    # Save final restock list
+    result = get_quarterly_restock(demand_df, stock_df, z_score)
+    result.to_csv(RESTOCK_LIST_PATH, index=False)
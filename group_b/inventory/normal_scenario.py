@@ -1,66 +1,69 @@
 import pandas as pd
-import numpy as np
 from scipy.stats import norm
 from group_b.inventory.inventory_optimization import get_quarterly_reorder_point, get_quarterly_eoq
+from group_b.inventory.simulation import (NaivePolicy, ReorderPointPolicy, lead_time_in_periods, simulate,
+                                          to_period_matrix)
 
 
-def apply_naive_inventory_strategy(demand_df, stock_df):
+def apply_naive_inventory_strategy(demand_df, stock_df, reorder_fraction=0.8, order_fraction=1.1):
     """
     Naive inventory strategy with dynamic stock depletion, adjusted for realistic business conditions.
 
     Adjustments:
     - Reorder when stock < 80% of last quarter’s demand (instead of 50%).
-    - Maintain safety stock at 50% of last quarter’s demand.
     - Order 110% of last quarter’s demand when restocking.
-    - Track rolling stock levels and unmet demand.
+    - Track rolling stock levels and unmet demand, simulated quarter by quarter (see `simulation.simulate`), so that
+      stock carries over between quarters and orders arrive after the cluster's lead time.
+
+    Parameters:
+        demand_df (DataFrame): Demand per cluster and quarter ('cluster_label', 'year_quarter', 'predicted_demand').
+        stock_df (DataFrame): Stock per cluster ('cluster_label', 'stock_quantity', 'lead_time_months').
+        reorder_fraction (float): Reorder when stock < reorder_fraction x last quarter's demand.
+        order_fraction (float): Order order_fraction x last quarter's demand.
     """
     # Sort data
     demand_df = demand_df.sort_values(by=["cluster_label", "year_quarter"])
 
-    # Get last quarter's demand per cluster
-    demand_df["last_quarter_demand"] = demand_df.groupby("cluster_label")["predicted_demand"].shift(1)
-
-    # Adjust reorder point: Trigger reorder if stock falls below 80% of last quarter’s demand
-    demand_df["naive_reorder_point"] = demand_df["last_quarter_demand"] * 0.8
-
-    # Adjust safety stock: Set safety stock at 20% of last quarter's demand
-    demand_df["naive_safety_stock"] = demand_df["last_quarter_demand"] * 0.2
-
-    # Adjust order quantity: Order 110% of last quarter's demand when restocking
-    demand_df["naive_order_qty"] = demand_df["last_quarter_demand"] * 1.1
-
     # Merge with stock data
-    stock_df = stock_df[["cluster_label", "stock_quantity"]]
-    demand_df = demand_df.merge(stock_df, on="cluster_label", how="left")
+    demand_df = demand_df.merge(stock_df[["cluster_label", "stock_quantity"]], on="cluster_label", how="left")
 
-    # Determine if restocking is needed (based on the adjusted reorder point)
-    demand_df["naive_restock"] = demand_df["stock_quantity"] < demand_df["naive_reorder_point"]
+    # Simulate the naive policy: order a multiple of last quarter's demand when stock is below a fraction of it
+    result_df = simulate_policy(demand_df, stock_df, NaivePolicy(reorder_fraction=reorder_fraction,
+                                                                 order_fraction=order_fraction))
+    result_df = result_df.rename(columns={"to_restock": "naive_restock", "order_qty": "naive_order_qty"})
+    result_df["naive_restock"] = result_df["naive_restock"].astype(bool)
 
-    # Set order quantity to naive_order_qty only if restocking is needed
-    demand_df["naive_order_qty"] = np.where(demand_df["naive_restock"], demand_df["naive_order_qty"], 0)
+    demand_df = demand_df.merge(result_df, on=["cluster_label", "year_quarter"], how="left")
+    return demand_df.reset_index(drop=True)
 
-    # Update rolling stock levels over time
-    demand_df["rolling_stock"] = demand_df.groupby("cluster_label")["stock_quantity"].shift(1)
-    demand_df.loc[demand_df["year_quarter"] == demand_df["year_quarter"].min(), "rolling_stock"] = demand_df[
-        "stock_quantity"]
 
-    # Update rolling stock: subtract demand, add order
-    demand_df["rolling_stock"] = demand_df["rolling_stock"] - demand_df["predicted_demand"] + demand_df[
-        "naive_order_qty"]
+def simulate_policy(demand_df, stock_df, policy):
+    """
+    Simulate an ordering policy over the quarters of the demand dataframe, starting from the stock of stock_df.
 
-    # Track unmet demand if stock goes negative
-    demand_df["unmet_demand"] = demand_df["rolling_stock"].apply(lambda x: abs(x) if x < 0 else 0)
+    Parameters:
+        demand_df (DataFrame): Demand per cluster and quarter ('cluster_label', 'year_quarter', 'predicted_demand').
+        stock_df (DataFrame): Stock per cluster ('cluster_label', 'stock_quantity', 'lead_time_months').
+        policy (callable): Ordering policy, see `simulation.simulate`.
 
-    return demand_df.reset_index(drop=True)
+    Returns:
+        DataFrame: One row per cluster and quarter with the restock flag, order quantity, rolling stock (stock on
+                   hand at the end of the quarter) and unmet demand.
+    """
+    demand, clusters, periods = to_period_matrix(demand_df, "predicted_demand")
+    stock = stock_df.set_index("cluster_label").reindex(clusters)
+    result = simulate(demand, stock["stock_quantity"].fillna(0).to_numpy(),
+                      lead_time_in_periods(stock["lead_time_months"].fillna(0).to_numpy()), policy)
+    return result.to_frame(clusters, periods)
 
 
 def get_quarterly_restock(df_1, df_2, z_score):
     """
     Computes restocking decisions per quarter, with rolling stock updates and stockout tracking.
 
-    - Orders when stock < reorder point.
+    - Orders when the inventory position (stock on hand + in transit) <= reorder point.
     - Uses EOQ to determine optimal order quantity.
-    - Tracks rolling stock depletion.
+    - Tracks rolling stock depletion, quarter by quarter with lead times (see `simulation.simulate`).
     - Tracks stockouts (unmet demand).
     """
 
@@ -74,33 +77,47 @@ def get_quarterly_restock(df_1, df_2, z_score):
     to_restock_df = pd.merge(reorder_point_df, eoq_df, on=['cluster_label', 'year_quarter'])
     to_restock_df = pd.merge(to_restock_df, stock_df, on='cluster_label')
 
-    # Add restock flag
-    to_restock_df['to_restock'] = to_restock_df.apply(
-        lambda row: 1 if (row['stock_quantity'] <= row['reorder_point']) and
-                         (row['reorder_point'] > 0) and
-                         (row['optimal_qty'] > 0) else 0, axis=1)
-
-    # Rename for consistency
-    to_restock_df = to_restock_df.rename(columns={'optimal_qty': 'order_qty'})
-
-    # Implement rolling stock updates per quarter
-    to_restock_df["rolling_stock"] = to_restock_df.groupby("cluster_label")["stock_quantity"].shift(1)
+    # Simulate the reorder point / EOQ policy
+    _, clusters, periods = to_period_matrix(df_1, "predicted_demand")
+    reorder_point, _, _ = to_period_matrix(to_restock_df, "reorder_point", clusters, periods)
+    optimal_qty, _, _ = to_period_matrix(to_restock_df, "optimal_qty", clusters, periods)
+    result_df = simulate_policy(df_1, df_2, ReorderPointPolicy(reorder_point, optimal_qty))
 
-    # First quarter keeps initial stock
-    to_restock_df.loc[to_restock_df["year_quarter"] == to_restock_df["year_quarter"].min(), "rolling_stock"] = \
-        to_restock_df["stock_quantity"]
+    # Orders are only placed when restocking
+    to_restock_df = to_restock_df.drop(columns=['optimal_qty']).merge(result_df, on=['cluster_label', 'year_quarter'],
+                                                                      how='left')
 
-    # Update rolling stock (subtract demand, add new orders)
-    to_restock_df["rolling_stock"] = to_restock_df["rolling_stock"] - df_1["predicted_demand"] + to_restock_df[
-        "order_qty"]
+    return to_restock_df.reset_index(drop=True)
 
-    # Track unmet demand (if stock goes negative)
-    to_restock_df["unmet_demand"] = to_restock_df["rolling_stock"].apply(lambda x: abs(x) if x < 0 else 0)
 
-    return to_restock_df.reset_index(drop=True)
+def get_performance_metrics(result_df, by):
+    """
+    Compute the performance metrics of one strategy for each group of rows.
 
+    Parameters:
+        result_df (DataFrame): Result DataFrame of the strategy, with its order and holding costs.
+        by (str): Column of the groups.
 
-def compare_inventory_models(optimized_df, baseline_df, inventory_df):
+    Returns:
+        DataFrame: One row per group with the metrics of `compare_inventory_models`.
+    """
+    result_df = result_df.assign(
+        stockout=result_df["unmet_demand"] > 0,
+        ordering_cost=result_df["order_qty"] * result_df["order_cost"],
+        # Use rolling_stock but only count positive stock for holding cost calculation
+        total_holding_cost=result_df["rolling_stock"].where(result_df["rolling_stock"] > 0, 0) * result_df[
+            "holding_cost"])
+    grouped = result_df.groupby(by, sort=False)
+
+    metrics_df = pd.DataFrame({"Total Unmet Demand": grouped["unmet_demand"].sum(),
+                               "Stockout Rate (%)": grouped["stockout"].mean() * 100})
+    metrics_df["Service Level (%)"] = 100 - metrics_df["Stockout Rate (%)"]
+    metrics_df["Total Ordering Cost"] = grouped["ordering_cost"].sum()
+    metrics_df["Avg Holding Cost"] = grouped["total_holding_cost"].mean()
+    return metrics_df
+
+
+def compare_inventory_models(optimized_df, baseline_df, inventory_df, by=None):
     """
     Compare inventory performance between the optimized inventory algorithm and the baseline (naive) strategy.
 
@@ -108,9 +125,11 @@ def compare_inventory_models(optimized_df, baseline_df, inventory_df):
         optimized_df (DataFrame): Result DataFrame from the optimized inventory algorithm.
         baseline_df (DataFrame): Result DataFrame from the baseline (naive) strategy.
         inventory_df (DataFrame): Stock DataFrame containing cost data ('cluster_label', 'order_cost', 'holding_cost').
+        by (str): Column of both result DataFrames to compare the strategies on each group of rows separately, e.g.
+                  the replication of a Monte Carlo simulation. Default compares them on all rows.
 
     Returns:
-        comparison_df (DataFrame): A summary DataFrame comparing key performance metrics:
+        comparison_df (DataFrame): A summary DataFrame comparing key performance metrics (per group of `by`):
                                    - Total Unmet Demand
                                    - Stockout Rate (%)
                                    - Service Level (%)
@@ -127,75 +146,73 @@ def compare_inventory_models(optimized_df, baseline_df, inventory_df):
     optimized_df = optimized_df.merge(cost_df, on="cluster_label", how="left")
     baseline_df = baseline_df.merge(cost_df, on="cluster_label", how="left")
 
-    # For the Optimized Algorithm
-    total_unmet_optimized = optimized_df["unmet_demand"].sum()
-    stockout_rate_optimized = (optimized_df[optimized_df["unmet_demand"] > 0].shape[0] / optimized_df.shape[0]) * 100
-    service_level_optimized = 100 - stockout_rate_optimized
-    total_ordering_cost_optimized = (optimized_df["order_qty"] * optimized_df["order_cost"]).sum()
-
-    # Use rolling_stock but only count positive stock for holding cost calculation
-    positive_rolling_stock_optimized = optimized_df["rolling_stock"].where(optimized_df["rolling_stock"] > 0, 0)
-    avg_holding_cost_optimized = (positive_rolling_stock_optimized * optimized_df["holding_cost"]).sum() / max(
-        len(optimized_df), 1)
-
-    # For the Baseline (Naive) Strategy
-    total_unmet_baseline = baseline_df["unmet_demand"].sum()
-    stockout_rate_baseline = (baseline_df[baseline_df["unmet_demand"] > 0].shape[0] / baseline_df.shape[0]) * 100
-    service_level_baseline = 100 - stockout_rate_baseline
-    total_ordering_cost_baseline = (baseline_df["order_qty"] * baseline_df["order_cost"]).sum()
-    positive_rolling_stock_baseline = baseline_df["rolling_stock"].where(baseline_df["rolling_stock"] > 0, 0)
-    avg_holding_cost_baseline = (positive_rolling_stock_baseline * baseline_df["holding_cost"]).sum() / max(
-        len(baseline_df), 1)
+    # Compute the metrics of both strategies, on all rows as a single group unless `by` is given
+    group = by or "_all"
+    metrics = {model: get_performance_metrics(df.assign(_all=0) if by is None else df, group)
+               for model, df in [("Our Algorithm", optimized_df), ("Naive Strategy", baseline_df)]}
 
     # Create a summary comparison DataFrame
-    comparison_df = pd.DataFrame({
-        "Model": ["Our Algorithm", "Naive Strategy"],
-        "Total Unmet Demand": [total_unmet_optimized, total_unmet_baseline],
-        "Stockout Rate (%)": [round(stockout_rate_optimized, 2), round(stockout_rate_baseline, 2)],
-        "Service Level (%)": [round(service_level_optimized, 2), round(service_level_baseline, 2)],
-        "Total Ordering Cost": [round(total_ordering_cost_optimized, 2), round(total_ordering_cost_baseline, 2)],
-        "Avg Holding Cost": [round(avg_holding_cost_optimized, 2), round(avg_holding_cost_baseline, 2)]
-    })
+    comparison_df = pd.concat(metrics, names=["Model"]).reset_index()
+    if by is None:
+        comparison_df = comparison_df.drop(columns=group)
+    rounded = ["Stockout Rate (%)", "Service Level (%)", "Total Ordering Cost", "Avg Holding Cost"]
+    comparison_df[rounded] = comparison_df[rounded].round(2)
 
     return comparison_df
 
 
-# Load datasets
-demand_df = pd.read_csv("data/simulated_demand.csv")
-stock_df = pd.read_csv("data/simulated_stock.csv")
+def load_scenario_data(demand_path="data/simulated_demand.csv", stock_path="data/simulated_stock.csv"):
+    """
+    Load the simulated demand and stock datasets generated by `simulate_scenarios.py`.
+
+    Parameters:
+        demand_path (str): Path to the simulated demand.
+        stock_path (str): Path to the simulated stock.
+
+    Returns:
+        tuple: Demand dataframe (with year_quarter and moving average demand) and stock dataframe.
+    """
+    demand_df = pd.read_csv(demand_path)
+    stock_df = pd.read_csv(stock_path)
+
+    # Convert date column to datetime
+    demand_df['date'] = pd.to_datetime(demand_df['date'], format="%Y-%m-%d")
+
+    # Extract year and quarter from date
+    demand_df['year_quarter'] = demand_df['date'].dt.to_period("Q")
 
-# Convert date column to datetime
-demand_df['date'] = pd.to_datetime(demand_df['date'], format="%Y-%m-%d")
+    demand_df['moving_avg_demand'] = demand_df.groupby(by=['cluster_label'])['predicted_demand'].transform(
+        lambda x: x.rolling(window=10, min_periods=1).mean())
+    return demand_df, stock_df
 
-# Extract year and quarter from date
-demand_df['year_quarter'] = demand_df['date'].dt.to_period("Q")
 
-demand_df['moving_avg_demand'] = demand_df.groupby(by=['cluster_label'])['predicted_demand'].transform(
-    lambda x: x.rolling(window=10, min_periods=1).mean())
+if __name__ == '__main__':
+    # Load datasets
+    demand_df, stock_df = load_scenario_data()
 
-# Apply naive strategy
-naive_results_df = apply_naive_inventory_strategy(demand_df, stock_df)
+    # Apply naive strategy
+    naive_results_df = apply_naive_inventory_strategy(demand_df, stock_df)
 
-print(naive_results_df.head())
+    print(naive_results_df.head())
 
-# Save results if needed
-# naive_results_df.to_csv("../raw_data/naive_inventory_results.csv", index=False)
+    # Save results if needed
+    # naive_results_df.to_csv("../raw_data/naive_inventory_results.csv", index=False)
 
-# Apply our algo
-service_level = 0.95
-z_score = norm.ppf(service_level)
+    # Apply our algo
+    service_level = 0.95
+    z_score = norm.ppf(service_level)
 
-algo_result_df = get_quarterly_restock(demand_df, stock_df, z_score)
+    algo_result_df = get_quarterly_restock(demand_df, stock_df, z_score)
 
-print(algo_result_df.head())
+    print(algo_result_df.head())
 
-# Save results if needed
-# algo_result_df.to_csv("../raw_data/algo_result.csv", index=False)
+    # Save results if needed
+    # algo_result_df.to_csv("../raw_data/algo_result.csv", index=False)
 
-# Make comparison
-comparison = compare_inventory_models(algo_result_df, naive_results_df, stock_df)
+    # Make comparison
+    comparison = compare_inventory_models(algo_result_df, naive_results_df, stock_df)
 
-print(comparison)
+    print(comparison)
 
-# Save results
-comparison.to_csv("data/comparison_summary.csv", index=False)
+    # Save results
+    comparison.to_csv("data/comparison_summary.csv", index=False)
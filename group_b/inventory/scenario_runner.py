@@ -0,0 +1,192 @@
+import argparse
+import os
+
+import pandas as pd
+import numpy as np
+from joblib import Parallel, delayed
+from scipy.stats import norm, t as student_t
+from group_b.inventory.inventory_optimization import get_quarterly_reorder_point, get_quarterly_eoq
+from group_b.inventory.normal_scenario import compare_inventory_models, load_scenario_data
+from group_b.inventory.simulation import (NaivePolicy, ReorderPointPolicy, lead_time_in_periods, simulate,
+                                          to_period_matrix)
+
+METRICS = ["Total Unmet Demand", "Stockout Rate (%)", "Service Level (%)", "Total Ordering Cost", "Avg Holding Cost"]
+
+# Scenarios: the forecast demand and initial stock are scaled by `scale`, and the actual demand of every cluster and
+# quarter is the forecast multiplied by a random factor drawn from `perturbation`
+SCENARIOS = {
+    "normal": {"scale": 1.0, "perturbation": ("normal", 1.0, 0.1)},
+    "high_demand": {"scale": 5.0, "perturbation": ("normal", 1.0, 0.1)},
+    "low_demand": {"scale": 0.1, "perturbation": ("normal", 1.0, 0.1)},
+    "random_demand": {"scale": 1.0, "perturbation": ("uniform", 0.5, 1.5)},
+}
+
+
+def draw_perturbation(rng, perturbation, size):
+    """
+        Draw multiplicative demand factors.
+
+        Parameters:
+            rng (np.random.Generator): Random generator.
+            perturbation (tuple): ("normal", mean, std), ("uniform", low, high) or ("lognormal", mean, sigma) of the
+                                  underlying normal distribution.
+            size (tuple): Shape of the factors.
+
+        Returns:
+            np.ndarray: Non-negative demand factors.
+    """
+    kind, a, b = perturbation
+    if kind == "normal":
+        factors = rng.normal(a, b, size)
+    elif kind == "uniform":
+        factors = rng.uniform(a, b, size)
+    elif kind == "lognormal":
+        factors = rng.lognormal(a, b, size)
+    else:
+        raise ValueError(f"Unknown perturbation distribution: {kind}")
+    return np.maximum(factors, 0.0)
+
+
+def run_replications(seeds, forecast, clusters, stock_df, make_optimized, make_baseline, perturbation):
+    """
+        Run a batch of replications in one simulation per strategy: the replications are stacked along the cluster
+        axis, so all clusters of all replications advance together. The strategies are then compared on every
+        replication with `normal_scenario.compare_inventory_models`.
+
+        Parameters:
+            seeds (list): One np.random.SeedSequence per replication.
+            forecast (np.ndarray): Forecast demand per cluster and quarter, which the policies plan on.
+            clusters (np.ndarray): Cluster label of each row of forecast.
+            stock_df (pd.DataFrame): Stock data ('cluster_label', 'stock_quantity', 'lead_time_months', 'order_cost',
+                                     'holding_cost').
+            make_optimized (callable): Function of the number of replications returning the policy of our algorithm
+                                       for the stacked clusters.
+            make_baseline (callable): Same for the naive strategy.
+            perturbation (tuple): Distribution of the demand factors, see `draw_perturbation`.
+
+        Returns:
+            pd.DataFrame: One row per replication and model with the metrics.
+    """
+    n_replications, n_periods = len(seeds), forecast.shape[1]
+    demand = np.concatenate([forecast * draw_perturbation(np.random.default_rng(seed), perturbation, forecast.shape)
+                             for seed in seeds])
+    demand = np.round(demand)
+    stock = stock_df.set_index("cluster_label").reindex(clusters)
+    initial_stock = np.tile(stock["stock_quantity"].to_numpy(dtype=float), n_replications)
+    lead_time = np.tile(lead_time_in_periods(stock["lead_time_months"].to_numpy()), n_replications)
+    replications = np.repeat([seed.spawn_key[-1] for seed in seeds], len(clusters) * n_periods)
+
+    def simulate_frame(policy):
+        result = simulate(demand, initial_stock, lead_time, policy)
+        return result.to_frame(np.tile(clusters, n_replications), np.arange(n_periods)).assign(
+            replication=replications)
+
+    return compare_inventory_models(simulate_frame(make_optimized(n_replications)),
+                                    simulate_frame(make_baseline(n_replications)), stock_df, by="replication")
+
+
+def summarize(replications, confidence=0.95):
+    """
+        Aggregate the metrics of all replications into means and confidence intervals.
+
+        Parameters:
+            replications (pd.DataFrame): Metrics per replication, with scenario and Model columns.
+            confidence (float): Confidence level of the intervals.
+
+        Returns:
+            pd.DataFrame: Mean, standard deviation and confidence interval of each metric per scenario and model.
+    """
+    long_df = replications.melt(id_vars=["scenario", "Model", "replication"], value_vars=METRICS, var_name="metric")
+    summary = long_df.groupby(["scenario", "Model", "metric"], sort=False)["value"].agg(["mean", "std", "count"])
+    half_width = student_t.ppf((1 + confidence) / 2, summary["count"] - 1) * summary["std"] / np.sqrt(summary["count"])
+    summary["ci_low"] = summary["mean"] - half_width.fillna(0)
+    summary["ci_high"] = summary["mean"] + half_width.fillna(0)
+    return summary.reset_index()
+
+
+def scale_scenario(demand_df, stock_df, scale):
+    """
+        Scale the forecast demand and the initial stock of a scenario.
+
+        Parameters:
+            demand_df (pd.DataFrame): Forecast demand ('predicted_demand', 'moving_avg_demand').
+            stock_df (pd.DataFrame): Stock data ('stock_quantity').
+            scale (float): Multiplier of demand and stock.
+
+        Returns:
+            tuple: Scaled copies of demand_df and stock_df.
+    """
+    demand_df = demand_df.copy()
+    stock_df = stock_df.copy()
+    demand_df["predicted_demand"] = (demand_df["predicted_demand"] * scale).round()
+    demand_df["moving_avg_demand"] = demand_df["moving_avg_demand"] * scale
+    stock_df["stock_quantity"] = (stock_df["stock_quantity"] * scale).round()
+    return demand_df, stock_df
+
+
+def run_scenario(demand_df, stock_df, scenario, n_replications=1000, z_score=norm.ppf(0.95), seed=42, n_jobs=-1,
+                 batch_size=250):
+    """
+        Monte Carlo stress test of our algorithm and the naive strategy under a demand scenario.
+        The reorder points and EOQ are computed once from the (scaled) forecast, then every replication draws the
+        actual demand around the forecast and simulates both strategies. Replications are seeded individually from
+        `seed`, so the results do not depend on `n_jobs` or `batch_size`.
+
+        Parameters:
+            demand_df (pd.DataFrame): Forecast demand ('cluster_label', 'year_quarter', 'predicted_demand',
+                                      'moving_avg_demand').
+            stock_df (pd.DataFrame): Stock data ('cluster_label', 'stock_quantity', 'lead_time_months', 'order_cost',
+                                     'holding_cost').
+            scenario (dict): "scale" of demand and stock, and "perturbation" of the actual demand (see `SCENARIOS`).
+            n_replications (int): Number of replications.
+            z_score (float): Z-score for service level.
+            seed (int): Seed of the replications.
+            n_jobs (int): Number of worker processes, -1 for all CPUs.
+            batch_size (int): Number of replications simulated together by a worker.
+
+        Returns:
+            pd.DataFrame: Metrics per replication and model.
+    """
+    demand_df, stock_df = scale_scenario(demand_df, stock_df, scenario["scale"])
+    forecast, clusters, periods = to_period_matrix(demand_df, "predicted_demand")
+    plan_df = pd.merge(get_quarterly_reorder_point(demand_df, stock_df, z_score),
+                       get_quarterly_eoq(demand_df, stock_df), on=["cluster_label", "year_quarter"])
+    reorder_point, _, _ = to_period_matrix(plan_df, "reorder_point", clusters, periods)
+    optimal_qty, _, _ = to_period_matrix(plan_df, "optimal_qty", clusters, periods)
+
+    def make_optimized(n):
+        return ReorderPointPolicy(np.tile(reorder_point, (n, 1)), np.tile(optimal_qty, (n, 1)))
+
+    def make_baseline(n):
+        return NaivePolicy(reorder_fraction=0.8, order_fraction=1.1)
+
+    seeds = np.random.SeedSequence(seed).spawn(n_replications)
+    batches = [seeds[i:i + batch_size] for i in range(0, n_replications, batch_size)]
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(run_replications)(batch, forecast, clusters, stock_df, make_optimized, make_baseline,
+                                  scenario["perturbation"])
+        for batch in batches)
+    return pd.concat(results, ignore_index=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Monte Carlo stress test of the inventory strategies.")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--replications", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--jobs", type=int, default=-1, help="Number of worker processes")
+    parser.add_argument("--output", default="data/monte_carlo_summary.csv")
+    args = parser.parse_args()
+
+    # Load datasets
+    demand_df, stock_df = load_scenario_data()
+
+    replications = pd.concat([
+        run_scenario(demand_df, stock_df, SCENARIOS[name], n_replications=args.replications, seed=args.seed,
+                     n_jobs=args.jobs).assign(scenario=name)
+        for name in args.scenarios], ignore_index=True)
+    summary = summarize(replications)
+    print(summary.to_string(index=False))
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    summary.to_csv(args.output, index=False)
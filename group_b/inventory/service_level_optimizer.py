@@ -0,0 +1,280 @@
+import argparse
+import os
+
+import pandas as pd
+import numpy as np
+from joblib import Parallel, delayed
+from scipy.stats import norm
+from group_b.inventory.inventory_optimization import get_quarterly_reorder_point, get_quarterly_eoq
+from group_b.inventory.normal_scenario import load_scenario_data
+from group_b.inventory.scenario_runner import SCENARIOS, draw_perturbation, scale_scenario
+from group_b.inventory.simulation import ReorderPointPolicy, lead_time_in_periods, simulate, to_period_matrix
+
+# Candidate policies searched for every cluster
+SERVICE_LEVELS = [0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.975, 0.99, 0.995]
+REVIEW_PERIODS = [1, 2]
+
+# Service level of the scenario tests, whose plan (`get_quarterly_reorder_point`, reviewed every quarter) is reported
+# as the baseline of the optimised plan
+BASELINE_SERVICE_LEVEL = 0.95
+
+# A lost sale costs the unit (its order cost) plus the lost margin, taken as the same amount by default
+STOCKOUT_COST_MULTIPLIER = 2.0
+
+
+def perturbation_moments(perturbation):
+    """
+        Mean and standard deviation of the demand factors drawn by `scenario_runner.draw_perturbation`.
+
+        Parameters:
+            perturbation (tuple): ("normal", mean, std), ("uniform", low, high) or ("lognormal", mean, sigma) of the
+                                  underlying normal distribution.
+
+        Returns:
+            tuple: Mean and standard deviation of the factors (ignoring the clipping of negative factors at 0).
+    """
+    kind, a, b = perturbation
+    if kind == "normal":
+        return a, b
+    if kind == "uniform":
+        return (a + b) / 2, (b - a) / np.sqrt(12)
+    if kind == "lognormal":
+        mean = np.exp(a + b ** 2 / 2)
+        return mean, mean * np.sqrt(np.expm1(b ** 2))
+    raise ValueError(f"Unknown perturbation distribution: {kind}")
+
+
+def protection_reorder_point(demand_mean, demand_std, lead_time, review_period, z_score):
+    """
+        Reorder point of a periodic review policy. An order placed in a period has to cover the demand until the
+        order placed at the next review arrives, i.e. over the lead time plus the review period (the protection
+        interval), so the reorder point is the expected demand over that interval plus z_score standard deviations
+        of it. Periods after the forecast horizon are assumed to repeat the last forecast quarter.
+
+        Parameters:
+            demand_mean (np.ndarray): Expected demand per cluster and quarter.
+            demand_std (np.ndarray): Standard deviation of the demand per cluster and quarter.
+            lead_time (np.ndarray): Lead time per cluster, in quarters.
+            review_period (int): Number of quarters between reviews.
+            z_score (float): Z-score of the service level.
+
+        Returns:
+            np.ndarray: Reorder point per cluster and quarter.
+    """
+    n_clusters, n_periods = demand_mean.shape
+    interval = np.asarray(lead_time, dtype=int) + review_period
+    rows, cols = np.arange(n_clusters)[:, None], np.arange(n_periods)[None, :] + interval[:, None]
+
+    def interval_sum(values):
+        padded = np.concatenate([values, np.repeat(values[:, -1:], interval.max(), axis=1)], axis=1)
+        cumulative = np.concatenate([np.zeros((n_clusters, 1)), np.cumsum(padded, axis=1)], axis=1)
+        return cumulative[rows, cols] - cumulative[:, :n_periods]
+
+    return interval_sum(demand_mean) + z_score * np.sqrt(interval_sum(demand_std ** 2))
+
+
+def policy_costs(result, n_candidates, n_replications, order_cost, holding_cost, stockout_cost):
+    """
+        Expected ordering, holding and stockout cost, and unmet demand, of every candidate policy and cluster of a
+        batched simulation. Stock left on hand or in transit at the end of the horizon is still sold afterwards, so
+        its order cost is credited back (ending_stock_value) and the total cost only charges the stock that was used.
+
+        Parameters:
+            result (SimulationResult): Simulation of n_candidates x n_replications x n_clusters rows, candidate by
+                                       candidate, then replication by replication.
+            n_candidates (int): Number of candidate policies.
+            n_replications (int): Number of replications.
+            order_cost (np.ndarray): Order cost per unit, per cluster.
+            holding_cost (np.ndarray): Holding cost per unit and period, per cluster.
+            stockout_cost (np.ndarray): Cost per unit of unmet demand, per cluster.
+
+        Returns:
+            dict: Name -> np.ndarray of shape (n_candidates, n_clusters), averaged over the replications.
+    """
+    shape = (n_candidates, n_replications, len(order_cost), -1)
+    unmet = result.unmet_demand.reshape(shape).sum(axis=3)
+    costs = {
+        "unmet_demand": unmet,
+        "ordering_cost": result.orders.reshape(shape).sum(axis=3) * order_cost,
+        "holding_cost": np.maximum(result.on_hand.reshape(shape), 0.0).sum(axis=3) * holding_cost,
+        "stockout_cost": unmet * stockout_cost,
+        "ending_stock_value": (np.maximum(result.on_hand.reshape(shape)[..., -1], 0.0)
+                               + result.on_order.reshape(shape)[..., -1]) * order_cost,
+    }
+    costs = {name: cost.mean(axis=1) for name, cost in costs.items()}
+    costs["total_cost"] = (costs["ordering_cost"] + costs["holding_cost"] + costs["stockout_cost"]
+                           - costs["ending_stock_value"])
+    return costs
+
+
+def evaluate_clusters(seeds, forecast, initial_stock, lead_time, reorder_points, review_periods, optimal_qty,
+                      n_replications, perturbation, order_cost, holding_cost, stockout_cost):
+    """
+        Simulate every candidate policy on a chunk of clusters in one batched simulation: the candidates and
+        replications are stacked along the cluster axis. All candidates of a cluster face the same demand draws
+        (common random numbers), so their costs differ only by the policy.
+
+        Parameters:
+            seeds (list): One np.random.SeedSequence per cluster of the chunk.
+            forecast (np.ndarray): Forecast demand per cluster and quarter.
+            initial_stock (np.ndarray): Initial stock per cluster.
+            lead_time (np.ndarray): Lead time per cluster, in quarters.
+            reorder_points (np.ndarray): Reorder point per candidate, cluster and quarter,
+                                         shape (n_candidates, n_clusters, n_periods).
+            review_periods (np.ndarray): Review period of each candidate, in quarters.
+            optimal_qty (np.ndarray): EOQ per cluster and quarter.
+            n_replications (int): Number of replications per candidate.
+            perturbation (tuple): Distribution of the demand factors, see `scenario_runner.draw_perturbation`.
+            order_cost (np.ndarray): Order cost per cluster.
+            holding_cost (np.ndarray): Holding cost per cluster.
+            stockout_cost (np.ndarray): Stockout cost per cluster.
+
+        Returns:
+            dict: Name -> np.ndarray of shape (n_candidates, n_clusters), see `policy_costs`.
+    """
+    n_candidates, n_clusters, n_periods = reorder_points.shape
+    n_copies = n_candidates * n_replications
+
+    # demand of shape (n_replications, n_clusters, n_periods), one random stream per cluster
+    factors = np.stack([draw_perturbation(np.random.default_rng(seed), perturbation, (n_replications, n_periods))
+                        for seed in seeds], axis=1)
+    demand = np.round(forecast * factors)
+    demand = np.tile(demand.reshape(-1, n_periods), (n_candidates, 1))
+
+    # policy parameters of every row: candidate x replication x cluster
+    reorder_point = np.repeat(reorder_points, n_replications, axis=0).reshape(-1, n_periods)
+    review_period = np.repeat(review_periods, n_replications * n_clusters)
+    policy = ReorderPointPolicy(reorder_point, np.tile(optimal_qty, (n_copies, 1)), review_period)
+
+    result = simulate(demand, np.tile(initial_stock, n_copies), np.tile(lead_time, n_copies), policy)
+    return policy_costs(result, n_candidates, n_replications, order_cost, holding_cost, stockout_cost)
+
+
+def select_policies(candidates, tie_tolerance=1e-6):
+    """
+        Pick the candidate with the lowest expected total cost of every cluster. Candidates within `tie_tolerance`
+        (relative) of the lowest cost are tied, and ties go to the candidate with the least expected unmet demand, then
+        the highest service level, then the shortest review period.
+
+        Parameters:
+            candidates (pd.DataFrame): Expected costs per candidate and cluster.
+            tie_tolerance (float): Relative cost difference under which candidates are tied.
+
+        Returns:
+            pd.DataFrame: One row per cluster.
+    """
+    min_cost = candidates.groupby("cluster_label")["total_cost"].transform("min")
+    tied = candidates[candidates["total_cost"] <= min_cost + tie_tolerance * min_cost.abs()]
+    tied = tied.sort_values(["cluster_label", "unmet_demand", "service_level", "review_period"],
+                            ascending=[True, True, False, True])
+    return tied.drop_duplicates("cluster_label").reset_index(drop=True)
+
+
+def optimize_service_levels(demand_df, stock_df, service_levels=SERVICE_LEVELS, review_periods=REVIEW_PERIODS,
+                            perturbation=("normal", 1.0, 0.1), n_replications=200, stockout_cost=None, seed=42,
+                            n_jobs=-1, chunk_size=50, tie_tolerance=1e-6):
+    """
+        Search the service level and review period of the reorder point / EOQ policy that minimise the expected total
+        ordering, holding and stockout cost of each cluster, with the simulation engine as the objective.
+        The safety stock of each candidate is based on the uncertainty of the actual demand around the forecast (the
+        standard deviation of `perturbation`), see `protection_reorder_point`. The plan of the scenario tests at
+        BASELINE_SERVICE_LEVEL is simulated on the same demand as the baseline.
+        Clusters are independent, so they are split into chunks evaluated in parallel. Every cluster draws its demand
+        from its own seed, so the plan does not depend on `n_jobs` or `chunk_size`.
+
+        Parameters:
+            demand_df (pd.DataFrame): Forecast demand ('cluster_label', 'year_quarter', 'predicted_demand',
+                                      'moving_avg_demand').
+            stock_df (pd.DataFrame): Stock data ('cluster_label', 'stock_quantity', 'lead_time_months', 'order_cost',
+                                     'holding_cost').
+            service_levels (list): Candidate service levels.
+            review_periods (list): Candidate review periods, in quarters.
+            perturbation (tuple): Distribution of the actual demand around the forecast.
+            n_replications (int): Number of replications per candidate and cluster.
+            stockout_cost (array-like): Cost per unit of unmet demand, per cluster or for all clusters.
+                                        Default is STOCKOUT_COST_MULTIPLIER x order cost.
+            seed (int): Seed of the demand draws.
+            n_jobs (int): Number of worker processes, -1 for all CPUs.
+            chunk_size (int): Number of clusters simulated together by a worker.
+            tie_tolerance (float): Relative cost difference under which candidates are tied, see `select_policies`.
+
+        Returns:
+            tuple: Policy table with the cost-optimal candidate of every cluster (and the cost of the baseline
+                   plan), and the expected costs of all candidates.
+    """
+    forecast, clusters, periods = to_period_matrix(demand_df, "predicted_demand")
+    stock = stock_df.set_index("cluster_label").reindex(clusters)
+    lead_time = lead_time_in_periods(stock["lead_time_months"].to_numpy())
+    order_cost = stock["order_cost"].to_numpy(dtype=float)
+    holding_cost = stock["holding_cost"].to_numpy(dtype=float)
+    if stockout_cost is None:
+        stockout_cost = STOCKOUT_COST_MULTIPLIER * order_cost
+    stockout_cost = np.broadcast_to(np.asarray(stockout_cost, dtype=float), (len(clusters),))
+
+    # candidates: every service level x review period, then the baseline plan reviewed every quarter
+    factor_mean, factor_std = perturbation_moments(perturbation)
+    grid = [(level, review) for level in service_levels for review in review_periods]
+    baseline_plan = get_quarterly_reorder_point(demand_df, stock_df, norm.ppf(BASELINE_SERVICE_LEVEL))
+    reorder_points = np.stack(
+        [protection_reorder_point(forecast * factor_mean, forecast * factor_std, lead_time, review, norm.ppf(level))
+         for level, review in grid]
+        + [to_period_matrix(baseline_plan, "reorder_point", clusters, periods)[0]])
+    candidate_reviews = np.array([review for _, review in grid] + [1])
+    optimal_qty, _, _ = to_period_matrix(get_quarterly_eoq(demand_df, stock_df), "optimal_qty", clusters, periods)
+
+    seeds = np.random.SeedSequence(seed).spawn(len(clusters))
+    chunks = [slice(i, i + chunk_size) for i in range(0, len(clusters), chunk_size)]
+    results = Parallel(n_jobs=n_jobs)(
+        delayed(evaluate_clusters)(seeds[chunk], forecast[chunk], stock["stock_quantity"].to_numpy(dtype=float)[chunk],
+                                   lead_time[chunk], reorder_points[:, chunk], candidate_reviews, optimal_qty[chunk],
+                                   n_replications, perturbation, order_cost[chunk], holding_cost[chunk],
+                                   stockout_cost[chunk])
+        for chunk in chunks)
+    costs = {name: np.concatenate([result[name] for result in results], axis=1) for name in results[0]}
+
+    # one row per candidate and cluster, the last candidate is the baseline
+    n_grid = len(grid)
+    candidates = pd.DataFrame({
+        "cluster_label": np.tile(clusters, n_grid),
+        "service_level": np.repeat([level for level, _ in grid], len(clusters)),
+        "z_score": np.repeat([norm.ppf(level) for level, _ in grid], len(clusters)),
+        "review_period": np.repeat(candidate_reviews[:n_grid], len(clusters)),
+        "reorder_point": reorder_points[:n_grid].mean(axis=2).ravel(),
+        "optimal_qty": np.tile(optimal_qty.mean(axis=1), n_grid),
+        **{name: cost[:n_grid].ravel() for name, cost in costs.items()},
+    })
+
+    policy_df = select_policies(candidates, tie_tolerance)
+    policy_df = policy_df.merge(pd.DataFrame({"cluster_label": clusters,
+                                              "baseline_total_cost": costs["total_cost"][n_grid]}),
+                                on="cluster_label", how="left")
+    policy_df["cost_saving"] = policy_df["baseline_total_cost"] - policy_df["total_cost"]
+    return policy_df, candidates
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Search the cost-optimal service level and review period per cluster.")
+    parser.add_argument("--scenario", choices=list(SCENARIOS), default="normal")
+    parser.add_argument("--replications", type=int, default=200)
+    parser.add_argument("--review-periods", type=int, nargs="+", default=REVIEW_PERIODS)
+    parser.add_argument("--stockout-cost", type=float, default=None,
+                        help="Cost per unit of unmet demand (default: 2 x order cost of the cluster)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--jobs", type=int, default=-1, help="Number of worker processes")
+    parser.add_argument("--output", default="data/service_level_policy.csv")
+    args = parser.parse_args()
+
+    # Load datasets
+    demand_df, stock_df = load_scenario_data()
+    scenario = SCENARIOS[args.scenario]
+    demand_df, stock_df = scale_scenario(demand_df, stock_df, scenario["scale"])
+
+    policy_df, _ = optimize_service_levels(demand_df, stock_df, review_periods=args.review_periods,
+                                           perturbation=scenario["perturbation"], n_replications=args.replications,
+                                           stockout_cost=args.stockout_cost, seed=args.seed, n_jobs=args.jobs)
+    print(policy_df.to_string(index=False))
+    print(f"Total expected cost: {policy_df['total_cost'].sum():.2f} (baseline plan at service level "
+          f"{BASELINE_SERVICE_LEVEL}: {policy_df['baseline_total_cost'].sum():.2f})")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    policy_df.to_csv(args.output, index=False)
@@ -0,0 +1,270 @@
+import numpy as np
+import pandas as pd
+
+
+def lead_time_in_periods(lead_time_months, period_months=3):
+    """
+        Convert lead times in months into whole periods, rounded up (e.g. 1 to 3 months is 1 quarter): an order placed
+        at the start of a period is only available from the start of the period in which it has arrived.
+        The same conversion is used to plan reorder points and safety stock (see `inventory_optimization`) and to
+        simulate them, so policies are scored against the lead time they were planned for.
+
+        Parameters:
+            lead_time_months (array-like): Lead time per cluster, in months.
+            period_months (float): Length of a simulation period in months (3 for quarters, 12 / 52 for weeks).
+
+        Returns:
+            np.ndarray: Lead time per cluster, in periods.
+    """
+    return np.ceil(np.asarray(lead_time_months, dtype=float) / period_months).astype(int)
+
+
+def to_period_matrix(df, value_col, clusters=None, periods=None, period_col="year_quarter", fill_value=0.0):
+    """
+        Pivot a long dataframe (one row per cluster and period) into a (cluster x period) array.
+
+        Parameters:
+            df (pd.DataFrame): Dataframe with cluster_label, `period_col` and `value_col` columns.
+            value_col (str): Column to pivot.
+            clusters (array-like): Cluster labels of the rows. Default is the sorted clusters of df.
+            periods (array-like): Periods of the columns. Default is the sorted periods of df.
+            period_col (str): Period column.
+            fill_value (float): Value of missing cluster-period pairs.
+
+        Returns:
+            tuple: The array, the cluster labels and the periods.
+    """
+    clusters = np.sort(df["cluster_label"].unique()) if clusters is None else np.asarray(clusters)
+    periods = np.sort(df[period_col].unique()) if periods is None else np.asarray(periods)
+    matrix = np.full((len(clusters), len(periods)), fill_value, dtype=float)
+    rows = pd.Index(clusters).get_indexer(df["cluster_label"])
+    cols = pd.Index(periods).get_indexer(df[period_col])
+    found = (rows >= 0) & (cols >= 0)
+    matrix[rows[found], cols[found]] = df[value_col].to_numpy(dtype=float)[found]
+    return matrix, clusters, periods
+
+
+class InventoryState:
+    """
+        Stock state of all clusters at the start of a period, after the arrivals of that period, as seen by a policy.
+
+        Attributes:
+            period (int): Index of the current period.
+            on_hand (np.ndarray): Stock available per cluster.
+            on_order (np.ndarray): Ordered stock per cluster that has not arrived yet (in transit).
+            past_demand (np.ndarray): Demand of the previous periods, shape (n_clusters, period).
+    """
+
+    def __init__(self, period, on_hand, on_order, past_demand):
+        self.period = period
+        self.on_hand = on_hand
+        self.on_order = on_order
+        self.past_demand = past_demand
+
+    @property
+    def inventory_position(self):
+        return self.on_hand + self.on_order
+
+    @property
+    def last_demand(self):
+        """Demand of the previous period per cluster, NaN in the first period."""
+        if self.period == 0:
+            return np.full(len(self.on_hand), np.nan)
+        return self.past_demand[:, -1]
+
+
+class NaivePolicy:
+    """
+        Naive strategy: order a multiple of last period's demand when the stock on hand falls below a fraction of it.
+
+        Parameters:
+            reorder_fraction (float): Reorder when stock on hand < reorder_fraction x last period's demand.
+            order_fraction (float): Order order_fraction x last period's demand.
+    """
+
+    def __init__(self, reorder_fraction=0.8, order_fraction=1.1):
+        self.reorder_fraction = reorder_fraction
+        self.order_fraction = order_fraction
+
+    def __call__(self, state):
+        last_demand = state.last_demand
+        restock = state.on_hand < last_demand * self.reorder_fraction
+        return np.where(restock, last_demand * self.order_fraction, 0.0)
+
+
+class ReorderPointPolicy:
+    """
+        Reorder point / EOQ policy with periodic review: when the inventory position (on hand + on order) is at or
+        below a positive reorder point, order the smallest number of lots of the optimal quantity that brings it back
+        above the reorder point (a single lot when the demand of a period is smaller than the EOQ).
+        The stock is reviewed, and orders placed, every `review_period` periods.
+
+        Parameters:
+            reorder_point (np.ndarray): Reorder point per cluster, shape (n_clusters,) or (n_clusters, n_periods).
+            order_qty (np.ndarray): Order quantity (EOQ) per cluster, same shapes as reorder_point.
+            review_period (int or np.ndarray): Number of periods between reviews, per cluster or for all clusters.
+    """
+
+    def __init__(self, reorder_point, order_qty, review_period=1):
+        self.reorder_point = np.asarray(reorder_point, dtype=float)
+        self.order_qty = np.asarray(order_qty, dtype=float)
+        self.review_period = np.asarray(review_period, dtype=int)
+
+    @staticmethod
+    def _at(values, period):
+        return values[:, period] if values.ndim == 2 else values
+
+    def __call__(self, state):
+        reorder_point = self._at(self.reorder_point, state.period)
+        order_qty = self._at(self.order_qty, state.period)
+        inventory_position = state.inventory_position
+        restock = ((state.period % self.review_period == 0) & (inventory_position <= reorder_point)
+                   & (reorder_point > 0) & (order_qty > 0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lots = np.floor((reorder_point - inventory_position) / order_qty) + 1
+        return np.where(restock, lots * order_qty, 0.0)
+
+
+class LearnedPolicy:
+    """
+        Policy learned from a Q-table, e.g. `inventory_q_learning.InventoryReinforcementLearning.q_df`: in each period,
+        take the best known action (restock or not) for the current stock level.
+
+        Parameters:
+            q_table (pd.DataFrame): Q-values with state_key (stock level), action_key (1 to restock, 0 otherwise) and
+                                    q_value columns.
+            order_qty (float or np.ndarray): Quantity ordered per cluster when restocking.
+            stock_scale (float): Units of stock per Q-table state, to map stock levels onto the states the table was
+                                 learned on.
+    """
+
+    def __init__(self, q_table, order_qty, stock_scale=1.0):
+        best = q_table.sort_values("q_value").drop_duplicates("state_key", keep="last")
+        self.states = best["state_key"].to_numpy(dtype=float)
+        self.actions = best["action_key"].to_numpy(dtype=int)
+        order = np.argsort(self.states)
+        self.states, self.actions = self.states[order], self.actions[order]
+        self.order_qty = order_qty
+        self.stock_scale = stock_scale
+
+    def __call__(self, state):
+        # look up the nearest learned state at or below the current stock level
+        stock = state.inventory_position / self.stock_scale
+        idx = np.clip(np.searchsorted(self.states, stock, side="right") - 1, 0, len(self.states) - 1)
+        return np.where(self.actions[idx] == 1, self.order_qty, 0.0)
+
+
+class SimulationResult:
+    """
+        Per-period history of a simulation, arrays of shape (n_clusters, n_periods).
+
+        Attributes:
+            orders: Quantity ordered at the start of each period.
+            received: Quantity received at the start of each period.
+            on_hand: Stock on hand at the end of each period.
+            on_order: Stock in transit at the end of each period.
+            unmet_demand: Demand that could not be served from stock in each period.
+    """
+
+    def __init__(self, orders, received, on_hand, on_order, unmet_demand):
+        self.orders = orders
+        self.received = received
+        self.on_hand = on_hand
+        self.on_order = on_order
+        self.unmet_demand = unmet_demand
+
+    def to_frame(self, clusters, periods, period_col="year_quarter"):
+        """
+            Long dataframe with one row per cluster and period, in the format of the scenario tests.
+
+            Parameters:
+                clusters (array-like): Cluster label of each row of the arrays.
+                periods (array-like): Period of each column of the arrays.
+                period_col (str): Name of the period column.
+
+            Returns:
+                pd.DataFrame: cluster_label, period, to_restock, order_qty, received, rolling_stock, on_order and
+                              unmet_demand columns.
+        """
+        n_clusters, n_periods = self.orders.shape
+        return pd.DataFrame({
+            "cluster_label": np.repeat(np.asarray(clusters), n_periods),
+            period_col: np.tile(np.asarray(periods), n_clusters),
+            "to_restock": (self.orders > 0).ravel().astype(int),
+            "order_qty": self.orders.ravel(),
+            "received": self.received.ravel(),
+            "rolling_stock": self.on_hand.ravel(),
+            "on_order": self.on_order.ravel(),
+            "unmet_demand": self.unmet_demand.ravel(),
+        })
+
+
+def simulate(demand, initial_stock, lead_time, policy, backorders=False):
+    """
+        Simulate the stock of all clusters period by period under an ordering policy.
+        In each period, for all clusters at once:
+        1. orders placed `lead_time` periods ago arrive,
+        2. the policy sees the stock state and places orders, which arrive `lead_time` periods later
+           (immediately if the lead time is 0),
+        3. demand is served from the stock on hand, and the shortfall is recorded as unmet demand.
+        Stock carries over from one period to the next.
+
+        Parameters:
+            demand (np.ndarray): Demand per cluster and period, shape (n_clusters, n_periods).
+            initial_stock (array-like): Stock on hand per cluster at the start of the first period.
+            lead_time (array-like): Lead time per cluster in whole periods, see `lead_time_in_periods`.
+            policy (callable): Function of an `InventoryState` returning the quantity to order per cluster,
+                               e.g. `NaivePolicy`, `ReorderPointPolicy` or `LearnedPolicy`.
+            backorders (bool): If True, unmet demand is backordered (stock on hand goes negative and is served by
+                               later arrivals). If False, unmet demand is lost.
+
+        Returns:
+            SimulationResult: History of orders, arrivals, stock levels and unmet demand.
+    """
+    demand = np.asarray(demand, dtype=float)
+    n_clusters, n_periods = demand.shape
+    lead_time = np.broadcast_to(np.asarray(lead_time, dtype=int), (n_clusters,))
+    if (lead_time < 0).any():
+        raise ValueError("Lead times must be non-negative")
+
+    # pipeline[:, i] holds the stock arriving at the start of period t where t % window == i
+    window = int(lead_time.max()) + 1
+    pipeline = np.zeros((n_clusters, window))
+    rows = np.arange(n_clusters)
+    on_hand = np.asarray(initial_stock, dtype=float).copy()
+    on_order = np.zeros(n_clusters)
+
+    history = {name: np.zeros((n_clusters, n_periods))
+               for name in ["orders", "received", "on_hand", "on_order", "unmet_demand"]}
+    for t in range(n_periods):
+        # 1. arrivals
+        received = pipeline[:, t % window].copy()
+        pipeline[:, t % window] = 0
+        on_hand += received
+        on_order -= received
+
+        # 2. orders
+        orders = np.asarray(policy(InventoryState(t, on_hand, on_order, demand[:, :t])), dtype=float)
+        orders = np.nan_to_num(np.broadcast_to(orders, (n_clusters,)), nan=0.0)
+        immediate = lead_time == 0
+        on_hand += np.where(immediate, orders, 0.0)
+        received = received + np.where(immediate, orders, 0.0)
+        pipeline[rows, (t + lead_time) % window] += np.where(immediate, 0.0, orders)
+        on_order += np.where(immediate, 0.0, orders)
+
+        # 3. demand
+        if backorders:
+            on_hand -= demand[:, t]
+            unmet = np.maximum(-on_hand, 0.0)
+        else:
+            served = np.minimum(np.maximum(on_hand, 0.0), demand[:, t])
+            unmet = demand[:, t] - served
+            on_hand -= served
+
+        history["orders"][:, t] = orders
+        history["received"][:, t] = received
+        history["on_hand"][:, t] = on_hand
+        history["on_order"][:, t] = on_order
+        history["unmet_demand"][:, t] = unmet
+
+    return SimulationResult(**history)
@@ -1,6 +1,41 @@
-import joblib
+import numpy as np
 import pandas as pd
 
+from group_b.data_io import ProcessCache, file_version, resolve_path
+from group_b.demand.feature_store import (FEATURE_STORE_PATH, LAG_COLUMNS, get_clusters, load_features, model_matrix,
+                                          next_quarter_features)
+from group_b.demand.forecast_cache import get_forecast_cache
+
+PRICE_ELASTICITY = 1.5
+MAX_PRICE_CHANGE = 0.25
+PRICE_STEP = 0.005
+
+# feature store indexed by (cluster_label, year, quarter), by path and versioned by the mtime of the file
+_indexed_features = ProcessCache()
+
+
+def to_price_change(forecasted_demand, baseline_demand):
+    """
+    Turn forecasted and baseline demand into price changes, clipped to +/-25% and rounded to steps of 0.5%.
+    Without baseline demand, any forecasted demand is the largest possible increase (+25%), and no forecasted demand
+    leaves the price unchanged.
+
+    :param forecasted_demand: Forecasted demand, scalar or array.
+    :param baseline_demand: Baseline demand (mean of the last 4 quarters), scalar or array.
+    :return: Suggested price change as a decimal, scalar or array.
+    """
+    forecasted_demand = np.asarray(forecasted_demand, dtype=float)
+    baseline_demand = np.asarray(baseline_demand, dtype=float)
+
+    # Calculate percentage difference from baseine demand
+    with np.errstate(divide="ignore", invalid="ignore"):
+        demand_diff = (forecasted_demand - baseline_demand) / baseline_demand
+    demand_diff = np.where(baseline_demand == 0, np.where(forecasted_demand > 0, np.inf, 0.0), demand_diff)
+
+    # Suggested price change percentage (assuming PED = - 1.5), should be within -25% to +25%
+    price_change = demand_diff / PRICE_ELASTICITY
+    return np.round(np.clip(price_change, -MAX_PRICE_CHANGE, MAX_PRICE_CHANGE) / PRICE_STEP) * PRICE_STEP
+
 
 def get_baseprice_pct(parameters):
     """
@@ -11,23 +46,14 @@ def get_baseprice_pct(parameters):
     :param demand_forecast_model: A trained forecasting model that predicts demandbased on cluster, year, and quarter.
     :return: Suggested price adjustment as a decimal (e.g., 0.05 for +5% increase).
     """
-    # Load model
-    demand_forecast_model = joblib.load("../demand/random_forest_model.joblib")
-    # Obtain forecasted demand
-    forecasted_demand = demand_forecast_model.predict(parameters)[0]
+    # Obtain forecasted demand from the latest model, the forest only runs for inputs that are not cached yet
+    forecasted_demand = get_forecast_cache("random_forest").predict(parameters)[0]
 
     # Obtain baseline demand
     baseline_demand = parameters[['num_sales_lag_1Q', 'num_sales_lag_2Q', 'num_sales_lag_3Q',
                                   'num_sales_lag_4Q']].sum().sum() / 4
 
-    # Calculate percentage difference from baseine demand
-    demand_diff = (forecasted_demand - baseline_demand) / baseline_demand
-
-    # Suggested price change percentage (assuming PED = - 1.5), should be within -25% to +25%
-    price_change = demand_diff / 1.5
-    price_change = round(max(min(price_change, 0.25), -0.25) / 0.005) * 0.005
-
-    return price_change
+    return float(to_price_change(forecasted_demand, baseline_demand))
 
 
 def get_parameters(cluster, year, quarter):
@@ -39,24 +65,74 @@ def get_parameters(cluster, year, quarter):
     :param quarter: The current quarter for which the price adjustment is calculated (1 to 4).
     :return: Suggested price adjustment as a decimal (e.g., 0.05 for +5% increase).
     """
-    # Load data set
-    df = pd.read_csv("../data/random_forest_dataset.csv")
-
     # Get time_index of previous quarter
     time_index = year + (quarter - 1) / 4
 
-    # Get parameters for prediction, based on parameters from previous quarter
-    df = df[df[f'cluster_{cluster}']]
-    parameters = df[df['time_index'] == time_index].copy()
-    parameters['num_sales_lag_4Q'] = parameters['num_sales_lag_3Q']
-    parameters['num_sales_lag_3Q'] = parameters['num_sales_lag_2Q']
-    parameters['num_sales_lag_2Q'] = parameters['num_sales_lag_1Q']
-    parameters['num_sales_lag_1Q'] = parameters['num_sales']
-    parameters = parameters.drop(columns=['num_sales'])
+    # Load only the stored features of this cluster and quarter, the filters are pushed down to the reader
+    features = load_features(filters=[('cluster_label', '==', cluster), ('time_index', '==', time_index)])
+    clusters = get_clusters(load_features(columns=['cluster_label']))
+
+    # Get parameters for prediction, based on parameters from previous quarter (shared with next_year_prediction)
+    parameters = model_matrix(next_quarter_features(features), clusters)
 
     return parameters
 
 
+def load_indexed_features(path=FEATURE_STORE_PATH):
+    """
+    Load the whole feature store into memory, indexed by (cluster_label, year, quarter). The features are cached per
+    process and reloaded only when the feature store on disk changes.
+
+    :param path: Path to the feature store, with or without extension.
+    :return: DataFrame of features with a sorted (cluster_label, year, quarter) index.
+    """
+    path = resolve_path(path)
+    return _indexed_features.get(path, file_version(path), lambda: load_features(path).set_index(
+        ['cluster_label', 'year', 'quarter'], drop=False).sort_index())
+
+
+def get_price_changes(keys=None, year=None, quarter=None, features=None):
+    """
+    Calculate the suggested price adjustments of many clusters and quarters with a single model prediction.
+    Either pass a list of (cluster, year, quarter), or only a year and quarter to reprice all clusters for that quarter.
+    As in `get_parameters`, the features of each given quarter are used to forecast the demand of the following quarter.
+
+    :param keys: List of (cluster, year, quarter) tuples.
+    :param year: The current year, used with `quarter` when `keys` is not given.
+    :param quarter: The current quarter (1 to 4), used with `year` when `keys` is not given.
+    :param features: Indexed features, see `load_indexed_features`. Default is the feature store.
+    :return: DataFrame with cluster_label, year, quarter, forecasted_demand, baseline_demand and price_change columns,
+             one row per requested (cluster, year, quarter), in the requested order.
+    """
+    if features is None:
+        features = load_indexed_features()
+    if keys is None:
+        if year is None or quarter is None:
+            raise ValueError("Pass either keys or both year and quarter")
+        clusters = features.index.get_level_values('cluster_label').unique()
+        keys = [(cluster, year, quarter) for cluster in clusters]
+
+    positions = features.index.get_indexer(pd.MultiIndex.from_tuples(list(keys)))
+    if (positions < 0).any():
+        missing = [key for key, position in zip(keys, positions) if position < 0]
+        raise KeyError(f"No stored features for (cluster, year, quarter): {missing[:10]}")
+    selected = features.iloc[positions].reset_index(drop=True)
+
+    # Build the shifted-lag model input of all requested rows once, and predict them together
+    parameters = model_matrix(next_quarter_features(selected), get_clusters(features))
+    forecasted_demand = get_forecast_cache("random_forest").predict(parameters)
+    baseline_demand = parameters[LAG_COLUMNS].to_numpy().mean(axis=1)
+
+    return pd.DataFrame({
+        'cluster_label': selected['cluster_label'].to_numpy(),
+        'year': selected['year'].to_numpy(),
+        'quarter': selected['quarter'].to_numpy(),
+        'forecasted_demand': forecasted_demand,
+        'baseline_demand': baseline_demand,
+        'price_change': to_price_change(forecasted_demand, baseline_demand),
+    })
+
+
 if __name__ == '__main__':
     # Inputs
     cluster = 2
@@ -69,3 +145,7 @@ if __name__ == '__main__':
     # Get recommended percentage of price adjustment
     price_adjustment = f'{get_baseprice_pct(parameters) * 100}%'
     print(price_adjustment)
+
+    # Get recommended price adjustments of all clusters for the same quarter in one call
+    print(get_price_changes(year=year, quarter=quarter))
+    get_forecast_cache("random_forest").flush()
@@ -0,0 +1,19 @@
+import warnings
+
+import numpy as np
+
+from group_b.pricing.demand_price_adjustment import MAX_PRICE_CHANGE, to_price_change
+
+
+def test_price_change_without_baseline_demand():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        price_change = to_price_change(np.array([12.0, 0.0, 9.0]), np.array([0.0, 0.0, 10.0]))
+
+    assert not np.isnan(price_change).any()
+    np.testing.assert_allclose(price_change, [MAX_PRICE_CHANGE, 0.0, -0.065])
+
+
+def test_price_change_of_scalars():
+    assert float(to_price_change(0.0, 0.0)) == 0.0
+    assert float(to_price_change(130.0, 100.0)) == 0.2
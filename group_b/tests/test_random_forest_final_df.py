@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from group_b.data_cleaning_scripts.random_forest_final_df import KEYS, aggregate_reviews, build_cluster_index
+
+
+def make_reviews(n_reviews, n_products, seed):
+    """
+    Random reviews with many reviews per timestamp, in random (not time) order.
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 40, n_reviews), unit="D")
+    return pd.DataFrame({
+        "parent_asin": [f"asin{i}" for i in rng.integers(0, n_products, n_reviews)],
+        "year": timestamps.year,
+        "quarter": timestamps.quarter,
+        "review": [f"review {i}" for i in range(n_reviews)],
+        "sentiment_score": rng.uniform(1, 5, n_reviews).round(1),
+        "rating": rng.integers(1, 6, n_reviews).astype(float),
+        "timestamp": timestamps,
+    })
+
+
+def chunks(df, chunk_size):
+    return [df.iloc[i:i + chunk_size] for i in range(0, len(df), chunk_size)]
+
+
+def sorted_totals(totals):
+    return totals.sort_values(KEYS).reset_index(drop=True)[KEYS + ["num_sales", "sentiment_count", "rating_count"]]
+
+
+def test_incremental_refresh_counts_each_review_once_with_unsorted_chunks():
+    n_products = 30
+    metadata = pd.DataFrame({"parent_asin": [f"asin{i}" for i in range(n_products)],
+                             "cluster_label": np.arange(n_products) % 4})
+    asin_index, asin_clusters = build_cluster_index(metadata)
+    reviews = make_reviews(2000, n_products, seed=0)
+    expected, _, _ = aggregate_reviews([reviews], asin_index, asin_clusters)
+
+    # first run on the reviews known so far, the rest (including reviews at the watermark) arrive later
+    cutoff = reviews["timestamp"].quantile(0.5)
+    known = reviews[(reviews["timestamp"] <= cutoff) & (reviews.index % 3 != 0)]
+    late = reviews.drop(known.index)
+    totals, watermark, keys = aggregate_reviews(chunks(known, 150), asin_index, asin_clusters)
+    assert watermark == known["timestamp"].max()
+
+    # second run on everything at or after the watermark, in unsorted chunks whose first chunk already passes the
+    # watermark; late reviews before the watermark are not read again, so add them to the first run's totals
+    before = late[late["timestamp"] < watermark]
+    totals, _, _ = aggregate_reviews([before], asin_index, asin_clusters, totals=totals)
+    refresh = reviews[reviews["timestamp"] >= watermark].sample(frac=1, random_state=1)
+    refresh = pd.concat([refresh[refresh["timestamp"] > watermark].head(50), refresh])
+    refresh = refresh[~refresh.index.duplicated()]
+    totals, new_watermark, _ = aggregate_reviews(chunks(refresh, 100), asin_index, asin_clusters, totals=totals,
+                                                 watermark=watermark, watermark_keys=keys)
+
+    assert new_watermark == reviews["timestamp"].max()
+    pd.testing.assert_frame_equal(sorted_totals(totals), sorted_totals(expected))
+
+
+def test_watermark_keys_accumulate_when_no_later_review_arrives():
+    metadata = pd.DataFrame({"parent_asin": ["asin0"], "cluster_label": [0]})
+    asin_index, asin_clusters = build_cluster_index(metadata)
+    reviews = make_reviews(10, 1, seed=1).assign(timestamp=pd.Timestamp("2023-03-01"))
+
+    totals, watermark, keys = aggregate_reviews([reviews.iloc[:4]], asin_index, asin_clusters)
+    totals, watermark, keys = aggregate_reviews(chunks(reviews, 3), asin_index, asin_clusters, totals=totals,
+                                                watermark=watermark, watermark_keys=keys)
+    assert watermark == pd.Timestamp("2023-03-01")
+    assert len(keys) == 10
+    assert totals["num_sales"].sum() == 10